@@ -0,0 +1,125 @@
+# Внешние зависимости
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Hashable, Optional, Set, Tuple
+# Внутренние модули
+from app.config import get_config
+
+
+config = get_config()
+
+# Канал Postgres NOTIFY: артикул, ответы по которому устарели (доставляется после коммита записи)
+REVIEWS_CACHE_CHANNEL = "reviews_cache"
+
+
+# Готовый к отдаче ответ: сериализованное тело и его ETag
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+    cached_at: float
+
+
+# LRU-кэш сериализованных ответов с ограничением по суммарному размеру в байтах.
+# У ключа (артикула) может быть несколько вариантов ответа - например, с разными порогами;
+# инвалидация ключа сбрасывает все варианты. Поколение ключа (вместе с эпохой всего кэша) защищает
+# от записи в кэш данных, прочитанных до инвалидации
+class ResponseCache:
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[int, Hashable], CachedResponse]" = OrderedDict()
+        self._variants: Dict[int, Set[Hashable]] = {}
+        self._generations: Dict[int, int] = {}
+        self._epoch = 0
+        self._size = 0
+        
+        
+    @staticmethod
+    def make_etag(body: bytes) -> str:
+        return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+    
+    
+    def generation(self, key: int) -> Tuple[int, int]:
+        return self._epoch, self._generations.get(key, 0)
+    
+    
+    def get(self, key: int, variant: Hashable = None) -> Optional[CachedResponse]:
+        entry = self._entries.get((key, variant))
+        if entry is None:
+            return None
+        
+        if self.ttl and time.monotonic() - entry.cached_at > self.ttl:
+            self._drop((key, variant))
+            return None
+        
+        self._entries.move_to_end((key, variant))
+        
+        return entry
+    
+    
+    def put(self, key: int, body: bytes, generation: Tuple[int, int], variant: Hashable = None) -> CachedResponse:
+        entry = CachedResponse(body=body, etag=self.make_etag(body), cached_at=time.monotonic())
+        
+        # Данные устарели, пока читались из БД, или ответ больше всего кэша
+        if generation != self.generation(key) or len(body) > self.max_bytes:
+            return entry
+        
+        self._drop((key, variant))
+        self._entries[(key, variant)] = entry
+        self._variants.setdefault(key, set()).add(variant)
+        self._size += len(body)
+        
+        while self._size > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            
+        return entry
+    
+    
+    def invalidate(self, key: int):
+        self._generations[key] = self._generations.get(key, 0) + 1
+        
+        for variant in list(self._variants.get(key, ())):
+            self._drop((key, variant))
+            
+            
+    # Сброс всего кэша, когда уведомления об изменениях могли быть пропущены
+    def clear(self):
+        self._epoch += 1
+        self._generations.clear()
+        self._entries.clear()
+        self._variants.clear()
+        self._size = 0
+        
+        
+    def _drop(self, entry_key: Tuple[int, Hashable]):
+        entry = self._entries.pop(entry_key, None)
+        if entry is not None:
+            self._size -= len(entry.body)
+            
+        key, variant = entry_key
+        variants = self._variants.get(key)
+        if variants is not None:
+            variants.discard(variant)
+            if not variants:
+                del self._variants[key]
+
+
+# Совпадает ли If-None-Match с текущим ETag
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+        
+    return False
+
+
+reviews_cache = ResponseCache(max_bytes=config.REVIEWS_CACHE_MAX_BYTES, ttl=config.REVIEWS_CACHE_TTL)
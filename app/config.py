@@ -3,22 +3,145 @@ from dataclasses import dataclass, field
 from dotenv import load_dotenv
 import os
 import logging
+from typing import List, Tuple
 # Внутренние модули
 from app.logger import setup_logger
 
 
 load_dotenv()
 
+
+# Читаем булев флаг из окружения
+def _env_bool(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
     
 @dataclass
 class Config:
     _database_url: str = field(default_factory=lambda: os.getenv("DATABASE_URL"))
+    
+    # Схема БД: при DB_AUTO_MIGRATE=false таблицы не создаются при старте, миграция - python -m app.migrate
+    DB_AUTO_MIGRATE: bool = field(default_factory=lambda: _env_bool("DB_AUTO_MIGRATE", "true"))
+    
+    # Пул соединений с БД на процесс. DB_MAX_CONNECTIONS > 0 - бюджет соединений узла,
+    # делится на WEB_CONCURRENCY процессов uvicorn (по умолчанию пул не ограничивается бюджетом)
+    DB_POOL_SIZE: int = field(default_factory=lambda: int(os.getenv("DB_POOL_SIZE", "5")))
+    DB_MAX_OVERFLOW: int = field(default_factory=lambda: int(os.getenv("DB_MAX_OVERFLOW", "10")))
+    DB_POOL_TIMEOUT: float = field(default_factory=lambda: float(os.getenv("DB_POOL_TIMEOUT", "30")))
+    DB_POOL_RECYCLE: float = field(default_factory=lambda: float(os.getenv("DB_POOL_RECYCLE", "1800")))
+    DB_MAX_CONNECTIONS: int = field(default_factory=lambda: int(os.getenv("DB_MAX_CONNECTIONS", "0")))
+    WEB_CONCURRENCY: int = field(default_factory=lambda: int(os.getenv("WEB_CONCURRENCY", "1")))
+    
+    # Адреса Wildberries (можно направить на локальную заглушку benchmarks/fake_wb.py).
+    # WB_FEEDBACK_MIRRORS - шаблоны с {imtId} через запятую, пусто - зеркала по умолчанию
+    WB_CARD_URL: str = field(default_factory=lambda: os.getenv("WB_CARD_URL", "https://u-card.wb.ru/cards/v4/detail"))
+    WB_FEEDBACK_MIRRORS: List[str] = field(
+        default_factory=lambda: [url.strip() for url in os.getenv("WB_FEEDBACK_MIRRORS", "").split(",") if url.strip()]
+    )
+    
+    # Пул HTTP-соединений к Wildberries
+    HTTP_MAX_CONNECTIONS: int = field(default_factory=lambda: int(os.getenv("HTTP_MAX_CONNECTIONS", "100")))
+    HTTP_MAX_KEEPALIVE: int = field(default_factory=lambda: int(os.getenv("HTTP_MAX_KEEPALIVE", "20")))
+    HTTP_KEEPALIVE_EXPIRY: float = field(default_factory=lambda: float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30")))
+    HTTP_MAX_PER_HOST: int = field(default_factory=lambda: int(os.getenv("HTTP_MAX_PER_HOST", "20")))
+    HTTP_TIMEOUT: float = field(default_factory=lambda: float(os.getenv("HTTP_TIMEOUT", "10")))
+    HTTP_CONNECT_TIMEOUT: float = field(default_factory=lambda: float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")))
+    HTTP2: bool = field(default_factory=lambda: _env_bool("HTTP2"))
+    
+    # Лимиты, повторы и circuit breaker для хостов Wildberries
+    UPSTREAM_RATE: float = field(default_factory=lambda: float(os.getenv("UPSTREAM_RATE", "10")))
+    UPSTREAM_RATE_MIN: float = field(default_factory=lambda: float(os.getenv("UPSTREAM_RATE_MIN", "0.5")))
+    UPSTREAM_RATE_MAX: float = field(default_factory=lambda: float(os.getenv("UPSTREAM_RATE_MAX", "50")))
+    UPSTREAM_BURST: float = field(default_factory=lambda: float(os.getenv("UPSTREAM_BURST", "10")))
+    UPSTREAM_RATE_INCREASE: float = field(default_factory=lambda: float(os.getenv("UPSTREAM_RATE_INCREASE", "0.1")))
+    UPSTREAM_RATE_DECREASE: float = field(default_factory=lambda: float(os.getenv("UPSTREAM_RATE_DECREASE", "0.5")))
+    UPSTREAM_MAX_RETRIES: int = field(default_factory=lambda: int(os.getenv("UPSTREAM_MAX_RETRIES", "2")))
+    UPSTREAM_BACKOFF_BASE: float = field(default_factory=lambda: float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.5")))
+    UPSTREAM_BACKOFF_MAX: float = field(default_factory=lambda: float(os.getenv("UPSTREAM_BACKOFF_MAX", "10")))
+    CIRCUIT_FAILURE_THRESHOLD: int = field(default_factory=lambda: int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")))
+    CIRCUIT_RESET_TIMEOUT: float = field(default_factory=lambda: float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30")))
+    
+    # Общий для всех процессов и узлов бюджет запросов к хосту Wildberries (через Postgres), 0 - выключен
+    UPSTREAM_SHARED_RATE: float = field(default_factory=lambda: float(os.getenv("UPSTREAM_SHARED_RATE", "0")))
+    UPSTREAM_SHARED_BURST: float = field(default_factory=lambda: float(os.getenv("UPSTREAM_SHARED_BURST", "20")))
+    
+    # Хеджированные запросы к зеркалам отзывов
+    FEEDBACK_HEDGE: bool = field(default_factory=lambda: _env_bool("FEEDBACK_HEDGE", "true"))
+    FEEDBACK_HEDGE_DELAY: float = field(default_factory=lambda: float(os.getenv("FEEDBACK_HEDGE_DELAY", "0.3")))
+    MIRROR_FAILURE_COOLDOWN: float = field(default_factory=lambda: float(os.getenv("MIRROR_FAILURE_COOLDOWN", "30")))
+    
+    # Потоковый разбор больших ответов с отзывами
+    FEEDBACK_STREAMING: bool = field(default_factory=lambda: _env_bool("FEEDBACK_STREAMING"))
+    FEEDBACK_STREAM_CHUNK_SIZE: int = field(default_factory=lambda: int(os.getenv("FEEDBACK_STREAM_CHUNK_SIZE", "65536")))
+    
+    # Кэш article -> imtId
+    IMTID_CACHE_SIZE: int = field(default_factory=lambda: int(os.getenv("IMTID_CACHE_SIZE", "100000")))
+    IMTID_CACHE_TTL: float = field(default_factory=lambda: float(os.getenv("IMTID_CACHE_TTL", "86400")))
+    
+    # Кэш ответов GET /api/v1/reviews/{article}
+    REVIEWS_CACHE_MAX_BYTES: int = field(default_factory=lambda: int(os.getenv("REVIEWS_CACHE_MAX_BYTES", str(64 * 1024 * 1024))))
+    REVIEWS_CACHE_TTL: float = field(default_factory=lambda: float(os.getenv("REVIEWS_CACHE_TTL", "300")))
+    REVIEWS_CACHE_LISTEN_CHECK_INTERVAL: float = field(default_factory=lambda: float(os.getenv("REVIEWS_CACHE_LISTEN_CHECK_INTERVAL", "30")))
+    
+    # Постраничное и потоковое чтение отзывов
+    REVIEWS_PAGE_MAX: int = field(default_factory=lambda: int(os.getenv("REVIEWS_PAGE_MAX", "1000")))
+    REVIEWS_STREAM_CHUNK: int = field(default_factory=lambda: int(os.getenv("REVIEWS_STREAM_CHUNK", "1000")))
+    
+    # Запись через COPY: с этого количества отзывов товара (11 параметров на строку, лимит asyncpg - 32767)
+    REVIEWS_COPY_THRESHOLD: int = field(default_factory=lambda: int(os.getenv("REVIEWS_COPY_THRESHOLD", "2000")))
+    
+    # Режим записи: threshold - только отзывы ниже порогов запроса, all - все отзывы, пороги применяются при чтении
+    INGEST_MODE: str = field(default_factory=lambda: os.getenv("INGEST_MODE", "threshold").lower())
+    
+    # Архив сырых ответов с отзывами
+    ARCHIVE_ENABLED: bool = field(default_factory=lambda: _env_bool("ARCHIVE_ENABLED", "false"))
+    ARCHIVE_FRESH_SECONDS: float = field(default_factory=lambda: float(os.getenv("ARCHIVE_FRESH_SECONDS", "600")))
+    ARCHIVE_MAX_BYTES: int = field(default_factory=lambda: int(os.getenv("ARCHIVE_MAX_BYTES", str(1024 * 1024 * 1024))))
+    ARCHIVE_COMPRESS_LEVEL: int = field(default_factory=lambda: int(os.getenv("ARCHIVE_COMPRESS_LEVEL", "6")))
+    
+    # Пакетный парсинг
+    PARSE_BATCH_CONCURRENCY: int = field(default_factory=lambda: int(os.getenv("PARSE_BATCH_CONCURRENCY", "10")))
+    PARSE_BATCH_MAX_ITEMS: int = field(default_factory=lambda: int(os.getenv("PARSE_BATCH_MAX_ITEMS", "5000")))
+    PARSE_BATCH_WRITE_CHUNK: int = field(default_factory=lambda: int(os.getenv("PARSE_BATCH_WRITE_CHUNK", "500")))
+    
+    # Очередь задач парсинга
+    JOB_WORKERS: int = field(default_factory=lambda: int(os.getenv("JOB_WORKERS", "4")))
+    JOB_POLL_INTERVAL: float = field(default_factory=lambda: float(os.getenv("JOB_POLL_INTERVAL", "2")))
+    JOB_LEASE_SECONDS: int = field(default_factory=lambda: int(os.getenv("JOB_LEASE_SECONDS", "300")))
+    JOB_MAX_ATTEMPTS: int = field(default_factory=lambda: int(os.getenv("JOB_MAX_ATTEMPTS", "3")))
+    JOB_RETRY_BACKOFF_BASE: float = field(default_factory=lambda: float(os.getenv("JOB_RETRY_BACKOFF_BASE", "5")))
+    JOB_RETRY_BACKOFF_MAX: float = field(default_factory=lambda: float(os.getenv("JOB_RETRY_BACKOFF_MAX", "300")))
+    
+    # Планировщик фонового обновления товаров
+    SCHEDULER_ENABLED: bool = field(default_factory=lambda: _env_bool("SCHEDULER_ENABLED"))
+    SCHEDULER_INTERVAL: float = field(default_factory=lambda: float(os.getenv("SCHEDULER_INTERVAL", "21600")))
+    SCHEDULER_CONCURRENCY: int = field(default_factory=lambda: int(os.getenv("SCHEDULER_CONCURRENCY", "4")))
+    SCHEDULER_RPS: float = field(default_factory=lambda: float(os.getenv("SCHEDULER_RPS", "2")))
+    SCHEDULER_QUIET_AFTER_DAYS: float = field(default_factory=lambda: float(os.getenv("SCHEDULER_QUIET_AFTER_DAYS", "7")))
+    SCHEDULER_QUIET_FACTOR: float = field(default_factory=lambda: float(os.getenv("SCHEDULER_QUIET_FACTOR", "4")))
+    SCHEDULER_BATCH: int = field(default_factory=lambda: int(os.getenv("SCHEDULER_BATCH", "100")))
+    SCHEDULER_IDLE_SLEEP: float = field(default_factory=lambda: float(os.getenv("SCHEDULER_IDLE_SLEEP", "60")))
+    SCHEDULER_RETRY_BACKOFF_BASE: float = field(default_factory=lambda: float(os.getenv("SCHEDULER_RETRY_BACKOFF_BASE", "300")))
+    SCHEDULER_RETRY_BACKOFF_MAX: float = field(default_factory=lambda: float(os.getenv("SCHEDULER_RETRY_BACKOFF_MAX", "86400")))
+    
+    # Логи: JSON или текст, очередь до потока вывода, лимит повторов одного сообщения (WARNING и выше)
+    LOG_FORMAT: str = field(default_factory=lambda: os.getenv("LOG_FORMAT", "json").lower())
+    LOG_QUEUE_SIZE: int = field(default_factory=lambda: int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+    LOG_REPEAT_BURST: int = field(default_factory=lambda: int(os.getenv("LOG_REPEAT_BURST", "10")))
+    LOG_REPEAT_WINDOW: float = field(default_factory=lambda: float(os.getenv("LOG_REPEAT_WINDOW", "60")))
+    # Запросы дольше порога пишутся в лог с временем этапов (INFO), остальные - на уровне DEBUG
+    LOG_SLOW_REQUEST_MS: float = field(default_factory=lambda: float(os.getenv("LOG_SLOW_REQUEST_MS", "1000")))
+    
     logger: logging.Logger = field(init=False)
     
     
     def __post_init__(self):
         self.logger = setup_logger(
-            level=os.getenv("LOG_LEVEL", "INFO")
+            level=os.getenv("LOG_LEVEL", "INFO"),
+            json_format=self.LOG_FORMAT != "text",
+            queue_size=self.LOG_QUEUE_SIZE,
+            repeat_burst=self.LOG_REPEAT_BURST,
+            repeat_window=self.LOG_REPEAT_WINDOW
         )
     
         self.validate()
@@ -30,6 +153,50 @@ class Config:
         if not self._database_url:
             self.logger.critical("DATABASE_URL is required in environment variables")
             raise ValueError("DATABASE_URL is required")
+            
+        if self.HTTP_MAX_CONNECTIONS < 1 or self.HTTP_MAX_PER_HOST < 1:
+            self.logger.critical("HTTP_MAX_CONNECTIONS and HTTP_MAX_PER_HOST must be positive")
+            raise ValueError("HTTP pool limits must be positive")
+            
+        if not 0 < self.UPSTREAM_RATE_MIN <= self.UPSTREAM_RATE <= self.UPSTREAM_RATE_MAX or self.UPSTREAM_BURST < 1:
+            self.logger.critical("Upstream rate limits must satisfy 0 < MIN <= RATE <= MAX and BURST >= 1")
+            raise ValueError("Invalid upstream rate limits")
+            
+        if self.UPSTREAM_SHARED_RATE < 0 or self.UPSTREAM_SHARED_BURST < 1:
+            self.logger.critical("UPSTREAM_SHARED_RATE must be non-negative and UPSTREAM_SHARED_BURST >= 1")
+            raise ValueError("Invalid shared upstream rate")
+            
+        if self.DB_POOL_SIZE < 1 or self.DB_MAX_OVERFLOW < 0 or self.WEB_CONCURRENCY < 1:
+            self.logger.critical("DB_POOL_SIZE and WEB_CONCURRENCY must be positive, DB_MAX_OVERFLOW non-negative")
+            raise ValueError("Invalid database pool settings")
+            
+        if self.DB_MAX_CONNECTIONS and self.DB_MAX_CONNECTIONS < self.WEB_CONCURRENCY:
+            self.logger.critical("DB_MAX_CONNECTIONS must allow at least one connection per worker")
+            raise ValueError("Database connection budget is too small")
+            
+        if self.PARSE_BATCH_CONCURRENCY < 1 or self.PARSE_BATCH_WRITE_CHUNK < 1:
+            self.logger.critical("PARSE_BATCH_CONCURRENCY and PARSE_BATCH_WRITE_CHUNK must be positive")
+            raise ValueError("Batch limits must be positive")
+            
+        if any("{imtId}" not in url for url in self.WB_FEEDBACK_MIRRORS):
+            self.logger.critical("Every WB_FEEDBACK_MIRRORS template must contain {imtId}")
+            raise ValueError("Invalid feedback mirror templates")
+            
+        if self.LOG_FORMAT not in ("json", "text") or self.LOG_QUEUE_SIZE < 1:
+            self.logger.critical("LOG_FORMAT must be 'json' or 'text' and LOG_QUEUE_SIZE positive")
+            raise ValueError("Invalid logging settings")
+            
+        if self.INGEST_MODE not in ("threshold", "all"):
+            self.logger.critical("INGEST_MODE must be 'threshold' or 'all'")
+            raise ValueError("Invalid ingest mode")
+            
+        if not 0 <= self.ARCHIVE_COMPRESS_LEVEL <= 9 or self.ARCHIVE_MAX_BYTES < 0:
+            self.logger.critical("ARCHIVE_COMPRESS_LEVEL must be 0-9 and ARCHIVE_MAX_BYTES non-negative")
+            raise ValueError("Invalid archive settings")
+            
+        if self.SCHEDULER_RPS <= 0 or self.SCHEDULER_CONCURRENCY < 1 or self.SCHEDULER_INTERVAL <= 0:
+            self.logger.critical("SCHEDULER_RPS, SCHEDULER_CONCURRENCY and SCHEDULER_INTERVAL must be positive")
+            raise ValueError("Scheduler limits must be positive")
         
         self.logger.debug("Configuration validation passed")
         
@@ -38,6 +205,17 @@ class Config:
     def DATABASE_URL(self) -> str:
         return self._database_url
     
+    
+    # Размер пула и переполнения одного процесса: в пределах бюджета DB_MAX_CONNECTIONS, если он задан
+    def db_pool_limits(self) -> Tuple[int, int]:
+        if not self.DB_MAX_CONNECTIONS:
+            return self.DB_POOL_SIZE, self.DB_MAX_OVERFLOW
+        
+        per_worker = self.DB_MAX_CONNECTIONS // self.WEB_CONCURRENCY
+        pool_size = min(self.DB_POOL_SIZE, per_worker)
+        
+        return pool_size, min(self.DB_MAX_OVERFLOW, per_worker - pool_size)
+    
 
     def __str__(self) -> str:
         return f"Config(database={self._database_url}, log_level={self.logger.level})"
@@ -0,0 +1,160 @@
+# Внешние зависимости
+import asyncio
+import sqlalchemy as sa
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncConnection
+from typing import Optional
+# Внутренние модули
+from app.cache import ResponseCache
+from app.config import get_config
+from app.crud import sql_take_rate_token
+from app.database import engine
+
+
+config = get_config()
+
+# Пространство ключей session-level advisory-блокировок лидера (второй ключ - роль)
+LEADER_LOCK_NAMESPACE = 0x4C44
+LEADER_SCHEDULER = 1
+
+
+# Бюджет запросов к хосту, общий для всех процессов и узлов: token bucket в таблице rate_budgets
+class SharedRateBudget:
+    def __init__(self, key: str, rate: float, burst: float):
+        self.key = key
+        self.rate = rate
+        self.burst = burst
+        
+        
+    async def acquire(self):
+        try:
+            delay = await sql_take_rate_token(key=self.key, rate=self.rate, burst=self.burst)
+            
+        # Недоступная БД не должна останавливать парсинг: остаётся локальный лимит процесса
+        except HTTPException:
+            config.logger.warning("Shared rate budget %s is unavailable, using the local limit only", self.key)
+            return
+            
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+# Лидер среди процессов: держит advisory-блокировку на отдельном соединении, пока оно живо
+class LeaderLock:
+    def __init__(self, role: int):
+        self.role = role
+        self._conn: Optional[AsyncConnection] = None
+        
+        
+    async def acquire(self) -> bool:
+        if self._conn is not None:
+            return True
+            
+        conn = await engine.connect()
+        
+        try:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            acquired = (await conn.execute(
+                sa.select(sa.func.pg_try_advisory_lock(LEADER_LOCK_NAMESPACE, self.role))
+            )).scalar_one()
+            
+        except Exception:
+            await conn.close()
+            raise
+            
+        if not acquired:
+            await conn.close()
+            return False
+            
+        self._conn = conn
+        return True
+        
+        
+    # Блокировка снимается вместе с соединением: проверяем, что оно живо
+    async def held(self) -> bool:
+        if self._conn is None:
+            return False
+            
+        try:
+            await self._conn.execute(sa.select(1))
+            return True
+            
+        except Exception as e:
+            config.logger.warning("Leader connection for role %s is lost: %s", self.role, e)
+            await self.release()
+            return False
+            
+            
+    async def release(self):
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+            
+        # Соединение могло уже оборваться - тогда блокировку снял сам Postgres
+        try:
+            await conn.execute(sa.select(sa.func.pg_advisory_unlock(LEADER_LOCK_NAMESPACE, self.role)))
+            await conn.close()
+            
+        except Exception:
+            await conn.invalidate()
+
+
+# Сброс кэша ответов по уведомлениям о записи из любого процесса: LISTEN на отдельном соединении.
+# Пока соединения нет, уведомления теряются - поэтому при каждом (пере)подключении кэш сбрасывается целиком
+class CacheInvalidationListener:
+    def __init__(self, cache: ResponseCache, channel: str):
+        self.cache = cache
+        self.channel = channel
+        self._task: Optional[asyncio.Task] = None
+        
+        
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            config.logger.info("Cache invalidation listener started on channel %s", self.channel)
+            
+            
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            
+            
+    def _on_notify(self, connection, pid, channel, payload):
+        try:
+            self.cache.invalidate(int(payload))
+            
+        except ValueError:
+            config.logger.warning("Unexpected payload on channel %s: %r", channel, payload)
+            
+            
+    async def _run(self):
+        while True:
+            try:
+                await self._listen()
+                
+            except Exception as e:
+                config.logger.warning("Cache invalidation listener connection is lost: %s", e)
+                
+            self.cache.clear()
+            await asyncio.sleep(config.REVIEWS_CACHE_LISTEN_CHECK_INTERVAL)
+            
+            
+    async def _listen(self):
+        conn = await engine.connect()
+        
+        try:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            raw = await conn.get_raw_connection()
+            await raw.driver_connection.add_listener(self.channel, self._on_notify)
+            self.cache.clear()
+            
+            # Проверяем, что соединение живо: оборванное молча перестаёт доставлять уведомления
+            while True:
+                await asyncio.sleep(config.REVIEWS_CACHE_LISTEN_CHECK_INTERVAL)
+                await conn.execute(sa.select(1))
+                
+        # Соединение с подпиской не возвращается в пул
+        finally:
+            await conn.invalidate()
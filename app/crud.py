@@ -1,57 +1,688 @@
 # Внешние зависимости
 import sqlalchemy as sa
-import sqlalchemy.orm as so
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.dialects.postgresql import insert, ARRAY
 from sqlalchemy.exc import NoResultFound, SQLAlchemyError, IntegrityError
 from fastapi import HTTPException, status
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple, Union, Optional, AsyncIterator
+from datetime import date, datetime, timezone, timedelta
+import base64
+from collections import Counter
 # Внутренние модули
 from app.config import get_config
-from app.models import Product, BadReview
-from app.database import connection
-from app.schemas import BadReviewSchem
+from app.models import (
+    Product, BadReview, ParseJob, FeedbackArchive, FeedbackArchiveUsage, RateBudget, ProductStats, ReviewStatsBucket,
+    SEARCH_CONFIG, STATS_RATING, STATS_DAY, STATS_COUNTRY, JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED
+)
+from app.database import connection, AsyncSessionLocal
+from app.cache import reviews_cache, REVIEWS_CACHE_CHANNEL
+from app.metrics import timed_db_operation
+from app.serialization import REVIEW_COLUMNS, EXPORT_FIELDS, SEARCH_FIELDS, rows_to_dicts
+from app.schemas import BadReviewSchem, RequestReviewSchem, ReviewFilterSchem
 
 
 config = get_config()
 
+# Пространство ключей advisory-блокировок записи отзывов (второй ключ - артикул)
+WRITE_LOCK_NAMESPACE = 0x5752
+# То же для записи архива ответов (второй ключ - imtId)
+ARCHIVE_LOCK_NAMESPACE = 0x4152
+# Строка счётчика размера архива
+ARCHIVE_USAGE_ID = 1
+# Сколько самых старых записей архива выбирается за один шаг вытеснения
+_ARCHIVE_EVICT_BATCH = 100
 
-# Получаем отзывы
+
+# Для товаров со всеми отзывами пороги, не заданные в запросе, берутся из последнего парсинга
+def _product_filters(product: Product, filters: ReviewFilterSchem) -> ReviewFilterSchem:
+    if not product.stores_all:
+        return filters
+    
+    return filters.model_copy(update={
+        "rating_stars": product.rating_stars if filters.rating_stars is None else filters.rating_stars,
+        "days_passed": product.days_passed if filters.days_passed is None else filters.days_passed
+    })
+
+
+# Получаем отзывы. Для товаров со всеми отзывами по умолчанию применяются пороги последнего парсинга
+@timed_db_operation("get_reviews")
 @connection
-async def sql_get_reviews(article: int, session: AsyncSession) -> Dict[str, Any]:
+async def sql_get_reviews(
+    article: int,
+    session: AsyncSession,
+    rating_stars: Optional[int] = None,
+    days_passed: Optional[int] = None
+) -> Dict[str, Any]:
     try:
-        product_result = await session.execute(
-            sa.select(Product)
-            .where(Product.article == article)
-            .options(so.selectinload(Product.bad_reviews))
-        )
+        product_result = await session.execute(sa.select(Product).where(Product.article == article))
         product = product_result.scalar_one()
-        reviews = product.bad_reviews or []
+        
+        # Пороги проверяются по индексу (product_id, rating, updatedDate)
+        filters = _product_filters(product, ReviewFilterSchem(rating_stars=rating_stars, days_passed=days_passed))
+        rating_stars, days_passed = filters.rating_stars, filters.days_passed
+        # Кортежи колонок вместо ORM-объектов: без identity map и обхода атрибутов
+        reviews_result = await session.execute(
+            sa.select(*REVIEW_COLUMNS).where(*_review_conditions(product.id, filters)).order_by(BadReview.id)
+        )
+        reviews = rows_to_dicts(reviews_result.all())
         
         return {
             "article": product.article,
             "imtId": product.imtId,
-            "rating_stars": product.rating_stars,
-            "days_passed": product.days_passed,
+            "rating_stars": product.rating_stars if rating_stars is None else rating_stars,
+            "days_passed": product.days_passed if days_passed is None else days_passed,
             "reviews_count": len(reviews),
-            "reviews": [review.to_dict() for review in reviews]
+            "reviews": reviews
         }
     
     
     except NoResultFound:
-        config.logger.info(f"Product not found for article {article}")
+        config.logger.info("Product not found for article %s", article)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
         
     except SQLAlchemyError as e:
-        config.logger.error(f"Database error reading reviews for article {article}: {e}")
+        config.logger.error("Database error reading reviews for article %s: %s", article, e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error")
         
     except Exception as e:
-        config.logger.error(f"Unexpected error reading reviews for article {article}: {e}")
+        config.logger.error("Unexpected error reading reviews for article %s: %s", article, e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unexpected server error")
         
         
-# Записываем отзывы
+# Курсор keyset-пагинации: (updatedDate, id) последнего отзыва страницы
+def encode_cursor(updated: datetime, review_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{updated.isoformat()}|{review_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        updated, review_id = raw.rsplit("|", 1)
+        
+        return datetime.fromisoformat(updated), int(review_id)
+    
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+# Условия фильтрации отзывов товара
+def _review_conditions(product_id: int, filters: ReviewFilterSchem) -> list:
+    conditions = [BadReview.product_id == product_id]
+    
+    if filters.rating_stars is not None:
+        conditions.append(BadReview.rating < filters.rating_stars)
+    if filters.days_passed is not None:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=filters.days_passed)
+        conditions.append(BadReview.updatedDate >= sa.literal(cutoff, sa.DateTime(timezone=True)))
+    if filters.rating_min is not None:
+        conditions.append(BadReview.rating >= filters.rating_min)
+    if filters.rating_max is not None:
+        conditions.append(BadReview.rating <= filters.rating_max)
+    if filters.date_from is not None:
+        conditions.append(BadReview.updatedDate >= filters.date_from)
+    if filters.date_to is not None:
+        conditions.append(BadReview.updatedDate <= filters.date_to)
+    if filters.country is not None:
+        conditions.append(BadReview.country == filters.country.upper())
+        
+    return conditions
+
+
+# Получаем товар по артикулу
+@connection
+async def sql_get_product(article: int, session: AsyncSession) -> Product:
+    try:
+        result = await session.execute(sa.select(Product).where(Product.article == article))
+        return result.scalar_one()
+    
+    except NoResultFound:
+        config.logger.info("Product not found for article %s", article)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+        
+    except SQLAlchemyError as e:
+        config.logger.error("Database error reading product for article %s: %s", article, e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error")
+        
+        
+# Получаем страницу отзывов: новые первыми, keyset по (updatedDate, id)
+@timed_db_operation("get_reviews_page")
+@connection
+async def sql_get_reviews_page(
+    article: int,
+    filters: ReviewFilterSchem,
+    limit: int,
+    session: AsyncSession,
+    cursor: Optional[str] = None
+) -> Dict[str, Any]:
+    product = await sql_get_product(article=article, session=session, no_decor=True)
+    conditions = _review_conditions(product.id, _product_filters(product, filters))
+    
+    if cursor:
+        updated, review_id = decode_cursor(cursor)
+        conditions.append(
+            sa.tuple_(BadReview.updatedDate, BadReview.id)
+            < sa.tuple_(sa.literal(updated, sa.DateTime(timezone=True)), sa.literal(review_id, sa.Integer))
+        )
+        
+    try:
+        result = await session.execute(
+            sa.select(BadReview)
+            .where(*conditions)
+            .order_by(BadReview.updatedDate.desc(), BadReview.id.desc())
+            .limit(limit + 1)
+        )
+        reviews = result.scalars().all()
+        
+    except SQLAlchemyError as e:
+        config.logger.error("Database error reading review page for article %s: %s", article, e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error")
+    
+    next_cursor = None
+    if len(reviews) > limit:
+        reviews = reviews[:limit]
+        next_cursor = encode_cursor(reviews[-1].updatedDate, reviews[-1].id)
+        
+    return {
+        "article": product.article,
+        "imtId": product.imtId,
+        "reviews": reviews,
+        "next_cursor": next_cursor
+    }
+
+
+# Потоково отдаём отзывы товара через серверный курсор (для NDJSON)
+async def stream_reviews(product: Product, filters: ReviewFilterSchem) -> AsyncIterator[Dict[str, Any]]:
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(
+            sa.select(*REVIEW_COLUMNS)
+            .where(*_review_conditions(product.id, _product_filters(product, filters)))
+            .order_by(BadReview.updatedDate.desc(), BadReview.id.desc())
+            .execution_options(yield_per=config.REVIEWS_STREAM_CHUNK)
+        )
+        
+        async for rows in result.partitions():
+            for review in rows_to_dicts(rows):
+                yield review
+        
+        
+# Выгрузка отзывов многих товаров (или всех) пачками через серверный курсор; since - по updatedDate
+async def stream_export(
+    articles: Optional[List[int]] = None,
+    since: Optional[datetime] = None
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    conditions = []
+    
+    if articles is not None:
+        conditions.append(Product.article == sa.any_(sa.bindparam("articles", articles, type_=ARRAY(sa.Integer))))
+    if since is not None:
+        conditions.append(BadReview.updatedDate >= sa.literal(since, sa.DateTime(timezone=True)))
+        
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(
+            sa.select(Product.article, Product.imtId, *REVIEW_COLUMNS)
+            .join(Product, Product.id == BadReview.product_id)
+            .where(*conditions)
+            .execution_options(yield_per=config.REVIEWS_STREAM_CHUNK)
+        )
+        
+        async for rows in result.partitions():
+            yield [dict(zip(EXPORT_FIELDS, row)) for row in rows]
+        
+        
+# Полнотекстовый поиск по отзывам (синтаксис websearch: "не тот размер", брак or запах, -доставка),
+# самые релевантные первыми; необязательные фильтры по товарам и рейтингу
+@timed_db_operation("search_reviews")
+@connection
+async def sql_search_reviews(
+    query: str,
+    session: AsyncSession,
+    articles: Optional[List[int]] = None,
+    rating_min: Optional[int] = None,
+    rating_max: Optional[int] = None,
+    limit: int = 100,
+    offset: int = 0
+) -> List[Dict[str, Any]]:
+    tsquery = sa.func.websearch_to_tsquery(sa.literal_column(f"'{SEARCH_CONFIG}'::regconfig"), query)
+    rank = sa.func.ts_rank_cd(BadReview.search_vector, tsquery)
+    conditions = [BadReview.search_vector.bool_op("@@")(tsquery)]
+    
+    if articles is not None:
+        conditions.append(Product.article == sa.any_(sa.bindparam("articles", articles, type_=ARRAY(sa.Integer))))
+    if rating_min is not None:
+        conditions.append(BadReview.rating >= rating_min)
+    if rating_max is not None:
+        conditions.append(BadReview.rating <= rating_max)
+        
+    try:
+        result = await session.execute(
+            sa.select(Product.article, *REVIEW_COLUMNS, rank)
+            .join(Product, Product.id == BadReview.product_id)
+            .where(*conditions)
+            .order_by(rank.desc(), BadReview.id.desc())
+            .limit(limit)
+            .offset(offset)
+        )
+        
+        return [dict(zip(SEARCH_FIELDS, row)) for row in result.all()]
+    
+    except SQLAlchemyError as e:
+        config.logger.error("Database error searching reviews for %r: %s", query, e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error")
+        
+    except Exception as e:
+        config.logger.error("Unexpected error searching reviews for %r: %s", query, e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unexpected server error")
+        
+        
+# Условия выборки строк статистики: период применяется только к дневному разрезу
+def _stats_conditions(day_from: Optional[date], day_to: Optional[date]) -> list:
+    conditions = []
+    
+    if day_from is not None:
+        conditions.append(sa.or_(ReviewStatsBucket.dimension != STATS_DAY, ReviewStatsBucket.bucket >= day_from.isoformat()))
+    if day_to is not None:
+        conditions.append(sa.or_(ReviewStatsBucket.dimension != STATS_DAY, ReviewStatsBucket.bucket <= day_to.isoformat()))
+        
+    return conditions
+
+
+# Строки (разрез, значение, количество) -> словари по разрезам: рейтинг и дни по возрастанию, страны по убыванию
+def _stats_breakdown(rows: List[Tuple[str, str, int]]) -> Dict[str, Dict[str, int]]:
+    groups = {STATS_RATING: [], STATS_DAY: [], STATS_COUNTRY: []}
+    for dimension, bucket, count in rows:
+        groups.setdefault(dimension, []).append((bucket, int(count)))
+        
+    return {
+        "by_rating": dict(sorted(groups[STATS_RATING], key=lambda item: int(item[0]))),
+        "by_day": dict(sorted(groups[STATS_DAY])),
+        "by_country": dict(sorted(groups[STATS_COUNTRY], key=lambda item: (-item[1], item[0])))
+    }
+
+
+# Статистика отзывов товара из предрасчитанных строк
+@timed_db_operation("get_review_stats")
+@connection
+async def sql_get_review_stats(
+    article: int,
+    session: AsyncSession,
+    day_from: Optional[date] = None,
+    day_to: Optional[date] = None
+) -> Dict[str, Any]:
+    product = await sql_get_product(article=article, session=session, no_decor=True)
+    
+    try:
+        stats = await session.get(ProductStats, product.id)
+        buckets = await session.execute(
+            sa.select(ReviewStatsBucket.dimension, ReviewStatsBucket.bucket, ReviewStatsBucket.count)
+            .where(ReviewStatsBucket.product_id == product.id, *_stats_conditions(day_from, day_to))
+        )
+        
+        return {
+            "article": product.article,
+            "imtId": product.imtId,
+            "reviews_count": stats.reviews_count if stats else 0,
+            "first_review_at": stats.first_review_at if stats else None,
+            "last_review_at": stats.last_review_at if stats else None,
+            **_stats_breakdown(buckets.all())
+        }
+    
+    except SQLAlchemyError as e:
+        config.logger.error("Database error reading review stats for article %s: %s", article, e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error")
+        
+    except Exception as e:
+        config.logger.error("Unexpected error reading review stats for article %s: %s", article, e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unexpected server error")
+
+
+# Статистика отзывов по всему каталогу: суммы предрасчитанных строк всех товаров
+@timed_db_operation("get_catalogue_stats")
+@connection
+async def sql_get_catalogue_stats(
+    session: AsyncSession,
+    day_from: Optional[date] = None,
+    day_to: Optional[date] = None
+) -> Dict[str, Any]:
+    try:
+        totals = await session.execute(
+            sa.select(
+                sa.func.count().filter(ProductStats.reviews_count > 0),
+                sa.func.coalesce(sa.func.sum(ProductStats.reviews_count), 0),
+                sa.func.min(ProductStats.first_review_at),
+                sa.func.max(ProductStats.last_review_at)
+            )
+        )
+        products_count, reviews_count, first_review_at, last_review_at = totals.one()
+        
+        buckets = await session.execute(
+            sa.select(ReviewStatsBucket.dimension, ReviewStatsBucket.bucket, sa.func.sum(ReviewStatsBucket.count))
+            .where(*_stats_conditions(day_from, day_to))
+            .group_by(ReviewStatsBucket.dimension, ReviewStatsBucket.bucket)
+        )
+        
+        return {
+            "products_count": products_count,
+            "reviews_count": int(reviews_count),
+            "first_review_at": first_review_at,
+            "last_review_at": last_review_at,
+            **_stats_breakdown(buckets.all())
+        }
+    
+    except SQLAlchemyError as e:
+        config.logger.error("Database error reading catalogue stats: %s", e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error")
+        
+    except Exception as e:
+        config.logger.error("Unexpected error reading catalogue stats: %s", e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unexpected server error")
+
+
+# Получаем известные сопоставления article -> imtId
+@connection
+async def sql_get_imtids(articles: List[int], session: AsyncSession) -> Dict[int, int]:
+    if not articles:
+        return {}
+    
+    try:
+        result = await session.execute(
+            sa.select(Product.article, Product.imtId).where(Product.article.in_(articles))
+        )
+        
+        return {article: imtId for article, imtId in result.all()}
+    
+    except SQLAlchemyError as e:
+        config.logger.error("Database error reading imtIds for %s articles: %s", len(articles), e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error")
+        
+    except Exception as e:
+        config.logger.error("Unexpected error reading imtIds for %s articles: %s", len(articles), e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unexpected server error")
+        
+        
+# Ключ идентичности отзыва: id отзыва Wildberries, для старых записей - дайджест содержимого
+def _review_key(wb_id: Optional[str], content_digest: bytes) -> tuple:
+    if wb_id:
+        return ("wb_id", wb_id)
+    
+    return ("digest", content_digest)
+
+
+# Сравниваем новые отзывы с сохранёнными: что вставить, что обновить, что оставить и что удалить
+def _diff_reviews(
+    existing: List[BadReview],
+    reviews: List[BadReviewSchem]
+) -> Tuple[List[Dict[str, Any]], List[Tuple[BadReview, Dict[str, Any]]], List[BadReview], List[BadReview]]:
+    by_key = {_review_key(row.wb_id, row.content_digest): row for row in existing}
+    to_insert, to_update, unchanged = [], [], []
+    seen_keys, matched_ids = set(), set()
+    
+    for review in reviews:
+        values = review.model_dump()
+        values["content_digest"] = BadReview.make_digest(values["text"], values["pros"], values["cons"])
+        key = _review_key(values["wb_id"], values["content_digest"])
+        
+        if key in seen_keys:
+            continue
+        
+        seen_keys.add(key)
+        row = by_key.get(key)
+        
+        # Запись, сохранённая до появления wb_id, сопоставляется по содержимому
+        if row is None and key[0] == "wb_id":
+            legacy = by_key.get(("digest", values["content_digest"]))
+            
+            if legacy is not None and not legacy.wb_id:
+                row = legacy
+        
+        if row is None or row.id in matched_ids:
+            to_insert.append(values)
+            continue
+        
+        matched_ids.add(row.id)
+        
+        if any(getattr(row, name) != value for name, value in values.items()):
+            to_update.append((row, values))
+        else:
+            unchanged.append(row)
+    
+    removed = [row for row in existing if row.id not in matched_ids]
+    
+    return to_insert, to_update, unchanged, removed
+
+
+# Разрезы статистики одного отзыва: рейтинг, страна, дата создания
+StatsKey = Tuple[int, str, datetime]
+
+# Строк статистики в одном INSERT (4 параметра на строку)
+_STATS_CHUNK = 5000
+
+
+def _stats_key(rating: int, country: str, created: datetime) -> StatsKey:
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)
+        
+    return rating, country, created
+
+
+def _row_stats_key(row: BadReview) -> StatsKey:
+    return _stats_key(row.rating, row.country, row.createdDate)
+
+
+# Инкрементально обновляем статистику товара: before - разрезы удалённых и прежние значения изменённых отзывов,
+# after - новые и изменённые отзывы. Запись товара уже под advisory-блокировкой, гонок между процессами нет
+async def _update_review_stats(
+    session: AsyncSession,
+    product_id: int,
+    before: List[StatsKey],
+    after: List[StatsKey]
+):
+    deltas = Counter()
+    for sign, keys in ((-1, before), (1, after)):
+        for rating, country, created in keys:
+            deltas[(STATS_RATING, str(rating))] += sign
+            deltas[(STATS_DAY, created.astimezone(timezone.utc).date().isoformat())] += sign
+            deltas[(STATS_COUNTRY, country)] += sign
+            
+    changes = [
+        {"product_id": product_id, "dimension": dimension, "bucket": bucket, "count": delta}
+        for (dimension, bucket), delta in deltas.items()
+        if delta
+    ]
+    
+    for start in range(0, len(changes), _STATS_CHUNK):
+        stmt = insert(ReviewStatsBucket).values(changes[start:start + _STATS_CHUNK])
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[ReviewStatsBucket.product_id, ReviewStatsBucket.dimension, ReviewStatsBucket.bucket],
+                set_={"count": ReviewStatsBucket.count + stmt.excluded.count}
+            )
+        )
+        
+    if any(change["count"] < 0 for change in changes):
+        await session.execute(
+            sa.delete(ReviewStatsBucket)
+            .where(ReviewStatsBucket.product_id == product_id, ReviewStatsBucket.count <= 0)
+        )
+        
+    stats = await session.get(ProductStats, product_id)
+    if stats is None:
+        stats = ProductStats(product_id=product_id, reviews_count=0)
+        session.add(stats)
+        
+    stats.reviews_count += len(after) - len(before)
+    removed_created = [created for _, _, created in before]
+    added_created = [created for _, _, created in after]
+    
+    # Ушёл отзыв на границе - пересчитываем границы по оставшимся отзывам товара
+    if (stats.first_review_at is not None and any(created <= stats.first_review_at for created in removed_created)) or \
+            (stats.last_review_at is not None and any(created >= stats.last_review_at for created in removed_created)):
+        bounds = await session.execute(
+            sa.select(sa.func.min(BadReview.createdDate), sa.func.max(BadReview.createdDate))
+            .where(BadReview.product_id == product_id)
+        )
+        stats.first_review_at, stats.last_review_at = bounds.one()
+        
+    elif added_created:
+        stats.first_review_at = min(filter(None, (stats.first_review_at, min(added_created))))
+        stats.last_review_at = max(filter(None, (stats.last_review_at, max(added_created))))
+
+
+# Колонки отзыва, которые загружаются через COPY во временную таблицу
+_STAGING_COLUMNS = [
+    "wb_id", "rating", "country", "name", "text", "pros", "cons",
+    "createdDate", "updatedDate", "content_digest"
+]
+
+_STAGING_DDL = sa.text("""
+    CREATE TEMP TABLE IF NOT EXISTS review_staging (
+        seq integer,
+        wb_id varchar(64),
+        rating integer,
+        country varchar(10),
+        name varchar(100),
+        text text,
+        pros text,
+        cons text,
+        "createdDate" timestamptz,
+        "updatedDate" timestamptz,
+        content_digest bytea
+    ) ON COMMIT DELETE ROWS
+""")
+
+# Сопоставление сохранённой строки b с загруженной s - те же правила, что в _diff_reviews
+_STAGING_MATCH = "((s.wb_id IS NOT NULL AND b.wb_id = s.wb_id) OR (b.wb_id IS NULL AND b.content_digest = s.content_digest))"
+
+_STAGING_DELETE = sa.text(f"""
+    DELETE FROM bad_reviews b
+    WHERE b.product_id = :product_id
+      AND NOT EXISTS (SELECT 1 FROM review_staging s WHERE {_STAGING_MATCH})
+    RETURNING b.rating, b.country, b."createdDate"
+""")
+
+# Колонки, возвращаемые после вставки отзывов: всё, кроме генерируемого поискового вектора
+_INSERT_RETURNING = [column for column in BadReview.__table__.columns if column.name != "search_vector"]
+
+_REVIEW_COLUMNS = ["id", "product_id", "wb_id", "rating", "country", "name", "text", "pros", "cons",
+                   '"createdDate"', '"updatedDate"', "content_digest"]
+_RETURN_COLUMNS = ", ".join(_REVIEW_COLUMNS)
+_STORED_COLUMNS = ", ".join(f"b.{name}" for name in _REVIEW_COLUMNS)
+# Прежние рейтинг, страна и дата обновлённых строк - для пересчёта статистики
+_OLD_STATS_COLUMNS = 'old_rating, old_country, "old_createdDate"'
+_NO_OLD_STATS = "NULL::integer, NULL::varchar, NULL::timestamptz"
+
+# Обновление изменившихся и вставка новых отзывов одним запросом; в ответе все актуальные строки товара.
+# seq - порядок отзыва в ответе Wildberries: дубликаты и спорные сохранённые строки разрешаются как в _diff_reviews
+_STAGING_MERGE = sa.text(f"""
+    WITH staged AS (
+        SELECT DISTINCT ON (COALESCE(s.wb_id, encode(s.content_digest, 'hex'))) s.*
+        FROM review_staging s
+        ORDER BY COALESCE(s.wb_id, encode(s.content_digest, 'hex')), s.seq
+    ),
+    candidates AS (
+        SELECT s.*, m.id AS candidate_id,
+               m.rating AS old_rating, m.country AS old_country, m."createdDate" AS "old_createdDate"
+        FROM staged s
+        LEFT JOIN LATERAL (
+            SELECT b.id, b.rating, b.country, b."createdDate" FROM bad_reviews b
+            WHERE b.product_id = :product_id AND {_STAGING_MATCH}
+            ORDER BY b.wb_id IS NULL
+            LIMIT 1
+        ) m ON true
+    ),
+    -- Старая строка без wb_id может подойти нескольким отзывам с разными wb_id:
+    -- она достаётся первому из них (как matched_ids в _diff_reviews), остальные вставляются как новые
+    claimed AS (
+        SELECT DISTINCT ON (candidate_id) candidate_id, seq
+        FROM candidates
+        WHERE candidate_id IS NOT NULL
+        ORDER BY candidate_id, seq
+    ),
+    matched AS (
+        SELECT c.*, cl.candidate_id AS existing_id
+        FROM candidates c
+        LEFT JOIN claimed cl ON cl.candidate_id = c.candidate_id AND cl.seq = c.seq
+    ),
+    updated AS (
+        UPDATE bad_reviews b
+        SET wb_id = m.wb_id, rating = m.rating, country = m.country, name = m.name,
+            text = m.text, pros = m.pros, cons = m.cons, "createdDate" = m."createdDate",
+            "updatedDate" = m."updatedDate", content_digest = m.content_digest
+        FROM matched m
+        WHERE b.id = m.existing_id
+          AND (b.wb_id, b.rating, b.country, b.name, b.text, b.pros, b.cons,
+               b."createdDate", b."updatedDate", b.content_digest)
+              IS DISTINCT FROM
+              (m.wb_id, m.rating, m.country, m.name, m.text, m.pros, m.cons,
+               m."createdDate", m."updatedDate", m.content_digest)
+        RETURNING b.*, m.old_rating, m.old_country, m."old_createdDate"
+    ),
+    inserted AS (
+        INSERT INTO bad_reviews (product_id, wb_id, rating, country, name, text, pros, cons,
+                                 "createdDate", "updatedDate", content_digest)
+        SELECT :product_id, m.wb_id, m.rating, m.country, m.name, m.text, m.pros, m.cons,
+               m."createdDate", m."updatedDate", m.content_digest
+        FROM matched m
+        WHERE m.existing_id IS NULL
+        ON CONFLICT DO NOTHING
+        RETURNING *
+    )
+    SELECT 'updated' AS op, {_RETURN_COLUMNS}, {_OLD_STATS_COLUMNS} FROM updated
+    UNION ALL
+    SELECT 'inserted' AS op, {_RETURN_COLUMNS}, {_NO_OLD_STATS} FROM inserted
+    UNION ALL
+    SELECT 'unchanged' AS op, {_STORED_COLUMNS}, {_NO_OLD_STATS}
+    FROM bad_reviews b
+    JOIN matched m ON m.existing_id = b.id
+    WHERE b.id NOT IN (SELECT id FROM updated)
+""")
+
+
+# Запись большого набора отзывов: binary COPY во временную таблицу и слияние на стороне Postgres
+async def _copy_merge_reviews(
+    session: AsyncSession,
+    product_id: int,
+    reviews: List[BadReviewSchem]
+) -> Tuple[List[BadReview], List[BadReview], List[BadReview], List[StatsKey]]:
+    records = []
+    for seq, review in enumerate(reviews):
+        values = review.model_dump()
+        values["content_digest"] = BadReview.make_digest(values["text"], values["pros"], values["cons"])
+        records.append((seq, *(values[name] for name in _STAGING_COLUMNS)))
+    
+    await session.execute(_STAGING_DDL)
+    await session.execute(sa.text("TRUNCATE review_staging"))
+    
+    # COPY идёт по тому же соединению и в той же транзакции, что и сессия
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        "review_staging",
+        records=records,
+        columns=["seq", *_STAGING_COLUMNS]
+    )
+    
+    # Удаление отдельным запросом: в одном WITH вставка могла бы упереться в ещё не удалённую строку
+    removed = (await session.execute(_STAGING_DELETE, {"product_id": product_id})).all()
+    merged = await session.execute(_STAGING_MERGE, {"product_id": product_id})
+    
+    inserted, updated, unchanged = [], [], []
+    previous = [_stats_key(*row) for row in removed]
+    groups = {"inserted": inserted, "updated": updated, "unchanged": unchanged}
+    for row in merged.mappings():
+        values = dict(row)
+        old = (values.pop("old_rating"), values.pop("old_country"), values.pop("old_createdDate"))
+        op = values.pop("op")
+        
+        if op == "updated":
+            previous.append(_stats_key(*old))
+            
+        groups[op].append(BadReview(**values))
+    
+    return inserted, updated, unchanged, previous
+
+
+# Записываем отзывы: вставляем новые, обновляем изменившиеся, удаляем выпавшие
+@timed_db_operation("write_reviews")
 @connection
 async def sql_write_reviews(
     article: int,
@@ -59,19 +690,28 @@ async def sql_write_reviews(
     rating_stars: int,
     days_passed: int,
     session: AsyncSession,
-    reviews: List[BadReviewSchem] = []
-) -> List[BadReview]:
+    reviews: List[BadReviewSchem] = [],
+    commit: bool = True,
+    stores_all: bool = False
+) -> Dict[str, Any]:
     
     try:
+        # Запись одного товара из разных процессов сериализуется до конца транзакции
+        await session.execute(sa.select(sa.func.pg_advisory_xact_lock(WRITE_LOCK_NAMESPACE, article)))
+        
         product_result = await session.execute(sa.select(Product).where(Product.article == article))
         product = product_result.scalar_one_or_none()
+        # Большие наборы пишутся через COPY: обычный INSERT упирается в лимит параметров запроса
+        use_copy = len(reviews) >= config.REVIEWS_COPY_THRESHOLD
+        existing = []
         
         if product is None:
             product = Product(
                 article=article,
                 imtId=imtId,
                 rating_stars=rating_stars,
-                days_passed=days_passed
+                days_passed=days_passed,
+                stores_all=stores_all
             )
             
             session.add(product)
@@ -81,45 +721,492 @@ async def sql_write_reviews(
             product.imtId = imtId
             product.rating_stars = rating_stars
             product.days_passed = days_passed
+            product.stores_all = stores_all
             
-            # Удаляем старые отзывы
-            await session.execute(
-                sa.delete(BadReview).where(BadReview.product_id == product.id)
-            )
-            
+            if not use_copy:
+                existing_result = await session.execute(
+                    sa.select(BadReview).where(BadReview.product_id == product.id)
+                )
+                existing = existing_result.scalars().all()
         
-        if reviews:
-            review_values = []
-            for data in reviews:
-                review_data = data.model_dump()
-                review_data["product_id"] = product.id
-                review_values.append(review_data)
+        if use_copy:
+            inserted, updated, unchanged, previous = await _copy_merge_reviews(session, product.id, reviews)
+            removed_count = len(previous) - len(updated)
             
-            # Вставка с обработкой конфликтов
-            stmt = (
-                insert(BadReview)
-                .values(review_values)
-                .on_conflict_do_nothing(
-                    constraint='uq_review_content'
+        else:
+            to_insert, to_update, unchanged, removed = _diff_reviews(existing, reviews)
+            previous = [_row_stats_key(row) for row in removed] + [_row_stats_key(row) for row, _ in to_update]
+            
+            # Удаляем только выпавшие отзывы; id передаются одним массивом
+            if removed:
+                await session.execute(
+                    sa.delete(BadReview).where(
+                        BadReview.id == sa.any_(
+                            sa.bindparam("removed_ids", [row.id for row in removed], type_=ARRAY(sa.Integer))
+                        )
+                    )
                 )
-            )
             
-            await session.execute(stmt)
+            # Изменившиеся поля пишутся при flush
+            for row, values in to_update:
+                row.update_from_dict(values)
+                
+            await session.flush()
             
-        await session.commit()
+            inserted = []
+            if to_insert:
+                for values in to_insert:
+                    values["product_id"] = product.id
+                
+                # Вставка с обработкой конфликтов, новые строки возвращаются через RETURNING (без поискового вектора).
+                # Без цели: в одной вставке строки с wb_id (uq_review_wb_id) и без него (uq_review_content_digest_legacy)
+                stmt = (
+                    insert(BadReview)
+                    .values(to_insert)
+                    .on_conflict_do_nothing()
+                    .returning(*_INSERT_RETURNING)
+                )
+                
+                inserted = (await session.scalars(sa.select(BadReview).from_statement(stmt))).all()
+            
+            updated = [row for row, _ in to_update]
+            removed_count = len(removed)
+            
+        await _update_review_stats(
+            session,
+            product.id,
+            before=previous,
+            after=[_row_stats_key(row) for row in updated] + [_row_stats_key(row) for row in inserted]
+        )
         
-        result = await session.execute(sa.select(BadReview).where(BadReview.product_id == product.id))
-        return result.scalars().all()
+        now = datetime.now(timezone.utc)
+        product.last_parsed_at = now
+        product.refresh_failures = 0
+        product.next_attempt_at = None
+        if inserted or updated or removed_count:
+            product.last_changed_at = now
+            
+        # Кэш других процессов сбрасывается по уведомлению; при откате транзакции (или savepoint) оно не отправляется
+        await session.execute(sa.select(sa.func.pg_notify(REVIEWS_CACHE_CHANNEL, str(article))))
+        
+        if commit:
+            await session.commit()
+            reviews_cache.invalidate(article)
+            
+        else:
+            await session.flush()
+            
+        config.logger.debug(
+            "Reviews for article %s: added %s, updated %s, removed %s%s",
+            article, len(inserted), len(updated), removed_count, " (COPY)" if use_copy else ""
+        )
+        
+        return {
+            "added": len(inserted),
+            "updated": len(updated),
+            "removed": removed_count,
+            "reviews": unchanged + updated + list(inserted)
+        }
         
     
     except IntegrityError as e:
-        config.logger.error(f"Integrity error writing reviews for article {article}: {e}")
+        config.logger.error("Integrity error writing reviews for article %s: %s", article, e)
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Database integrity error")
         
     except SQLAlchemyError as e:
-        config.logger.error(f"Database error writing reviews for article {article}: {e}")
+        config.logger.error("Database error writing reviews for article %s: %s", article, e)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error")
         
     except Exception as e:
-        config.logger.error(f"Unexpected error writing reviews for article {article}: {e}")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unexpected server error")
\ No newline at end of file
+        config.logger.error("Unexpected error writing reviews for article %s: %s", article, e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unexpected server error")
+        
+        
+# Записываем результаты пакетного парсинга: одна транзакция на чанк, savepoint на артикул
+@timed_db_operation("write_reviews_batch")
+@connection
+async def sql_write_reviews_batch(
+    batch: List[Tuple[RequestReviewSchem, int, List[BadReviewSchem]]],
+    session: AsyncSession,
+    stores_all: bool = False
+) -> Dict[int, Union[Dict[str, Any], HTTPException]]:
+    results: Dict[int, Union[Dict[str, Any], HTTPException]] = {}
+    chunk_size = config.PARSE_BATCH_WRITE_CHUNK
+    # Блокировки берутся в порядке артикулов, чтобы параллельные пакеты не попадали в deadlock
+    batch = sorted(batch, key=lambda entry: entry[0].article)
+    
+    for start in range(0, len(batch), chunk_size):
+        for item, imtId, reviews in batch[start:start + chunk_size]:
+            try:
+                async with session.begin_nested():
+                    results[item.article] = await sql_write_reviews(
+                        article=item.article,
+                        imtId=imtId,
+                        rating_stars=item.rating_stars,
+                        days_passed=item.days_passed,
+                        reviews=reviews,
+                        session=session,
+                        commit=False,
+                        stores_all=stores_all,
+                        no_decor=True
+                    )
+                    
+            except HTTPException as e:
+                results[item.article] = e
+        
+        try:
+            await session.commit()
+            
+            for item, _, _ in batch[start:start + chunk_size]:
+                reviews_cache.invalidate(item.article)
+            
+        except SQLAlchemyError as e:
+            config.logger.error("Database error committing review batch: %s", e)
+            await session.rollback()
+            
+            for item, _, _ in batch[start:start + chunk_size]:
+                results[item.article] = HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail="Database error"
+                )
+    
+    return results
+
+
+# Ставим задачу парсинга в очередь
+@connection
+async def sql_create_job(data: RequestReviewSchem, session: AsyncSession) -> ParseJob:
+    try:
+        job = ParseJob(
+            article=data.article,
+            rating_stars=data.rating_stars,
+            days_passed=data.days_passed,
+            status=JOB_QUEUED
+        )
+        
+        session.add(job)
+        await session.commit()
+        await session.refresh(job)
+        
+        return job
+    
+    except SQLAlchemyError as e:
+        config.logger.error("Database error enqueuing parse job for article %s: %s", data.article, e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error")
+        
+    except Exception as e:
+        config.logger.error("Unexpected error enqueuing parse job for article %s: %s", data.article, e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unexpected server error")
+
+
+# Получаем задачу по id
+@connection
+async def sql_get_job(job_id: int, session: AsyncSession) -> ParseJob:
+    try:
+        job = await session.get(ParseJob, job_id)
+        
+    except SQLAlchemyError as e:
+        config.logger.error("Database error reading parse job %s: %s", job_id, e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error")
+        
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+        
+    return job
+
+
+# Забираем следующую задачу: SKIP LOCKED позволяет нескольким воркерам и процессам не мешать друг другу.
+# Задачи, зависшие в running дольше аренды (процесс упал), забираются повторно
+@connection
+async def sql_claim_job(session: AsyncSession) -> Optional[ParseJob]:
+    now = datetime.now(timezone.utc)
+    
+    result = await session.execute(
+        sa.select(ParseJob)
+        .where(sa.or_(
+            sa.and_(
+                ParseJob.status == JOB_QUEUED,
+                sa.or_(ParseJob.not_before.is_(None), ParseJob.not_before <= now)
+            ),
+            sa.and_(
+                ParseJob.status == JOB_RUNNING,
+                ParseJob.started_at < now - timedelta(seconds=config.JOB_LEASE_SECONDS)
+            )
+        ))
+        .order_by(ParseJob.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    job = result.scalar_one_or_none()
+    
+    if job is None:
+        return None
+    
+    job.status = JOB_RUNNING
+    job.started_at = now
+    job.attempts += 1
+    await session.commit()
+    
+    return job
+
+
+# Завершаем задачу: результат, ошибка или возврат в очередь для повтора не раньше чем через retry_delay секунд
+@connection
+async def sql_finish_job(
+    job_id: int,
+    session: AsyncSession,
+    result: Optional[Dict[str, Any]] = None,
+    error: Optional[HTTPException] = None,
+    retry: bool = False,
+    retry_delay: float = 0
+):
+    job = await session.get(ParseJob, job_id)
+    if job is None:
+        return
+    
+    if error is None:
+        job.status = JOB_DONE
+        job.result = result
+        job.error = None
+        job.error_code = None
+        
+    else:
+        job.status = JOB_QUEUED if retry else JOB_FAILED
+        job.error = str(error.detail)
+        job.error_code = error.status_code
+        
+    now = datetime.now(timezone.utc)
+    job.finished_at = None if retry else now
+    job.not_before = now + timedelta(seconds=retry_delay) if retry else None
+    await session.commit()
+
+
+# Количество отслеживаемых товаров
+@connection
+async def sql_count_products(session: AsyncSession) -> int:
+    result = await session.execute(sa.select(sa.func.count()).select_from(Product))
+    
+    return result.scalar_one()
+
+
+# Товары, которым пора обновиться, по убыванию просроченности.
+# Товары без изменений дольше quiet_after обновляются в quiet_factor раз реже
+@connection
+async def sql_get_due_products(
+    interval: float,
+    quiet_after: timedelta,
+    quiet_factor: float,
+    limit: int,
+    session: AsyncSession
+) -> List[Product]:
+    now = datetime.now(timezone.utc)
+    
+    quiet = sa.or_(Product.last_changed_at.is_(None), Product.last_changed_at < now - quiet_after)
+    effective_interval = sa.case((quiet, interval * quiet_factor), else_=interval)
+    staleness = sa.func.extract("epoch", sa.literal(now, sa.DateTime(timezone=True)) - Product.last_parsed_at)
+    
+    result = await session.execute(
+        sa.select(Product)
+        .where(
+            sa.or_(Product.last_parsed_at.is_(None), staleness >= effective_interval),
+            # Товары после неудачного обновления ждут окончания задержки
+            sa.or_(Product.next_attempt_at.is_(None), Product.next_attempt_at <= now)
+        )
+        .order_by(Product.last_parsed_at.is_(None).desc(), (staleness / effective_interval).desc())
+        .limit(limit)
+    )
+    
+    return result.scalars().all()
+
+
+# Неудачное фоновое обновление: следующая попытка через экспоненциально растущую задержку
+@connection
+async def sql_record_refresh_failure(article: int, session: AsyncSession):
+    delay = sa.func.least(
+        config.SCHEDULER_RETRY_BACKOFF_MAX,
+        config.SCHEDULER_RETRY_BACKOFF_BASE * sa.func.power(2, Product.refresh_failures)
+    )
+    
+    try:
+        await session.execute(
+            sa.update(Product)
+            .where(Product.article == article)
+            .values(
+                refresh_failures=Product.refresh_failures + 1,
+                next_attempt_at=sa.func.now() + sa.func.make_interval(0, 0, 0, 0, 0, 0, delay)
+            )
+        )
+        await session.commit()
+        
+    except SQLAlchemyError as e:
+        config.logger.error("Database error recording refresh failure for article %s: %s", article, e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error")
+
+
+# Архив сырого ответа с отзывами по imtId
+@connection
+async def sql_get_archive(imtId: int, session: AsyncSession) -> Optional[FeedbackArchive]:
+    try:
+        return await session.get(FeedbackArchive, imtId)
+    
+    except SQLAlchemyError as e:
+        config.logger.error("Database error reading feedback archive for imtId %s: %s", imtId, e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error")
+        
+    except Exception as e:
+        config.logger.error("Unexpected error reading feedback archive for imtId %s: %s", imtId, e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unexpected server error")
+
+
+# Меняем счётчик размера архива на delta байт, возвращаем новый размер
+async def _add_archive_usage(session: AsyncSession, delta: int) -> int:
+    stmt = insert(FeedbackArchiveUsage).values(id=ARCHIVE_USAGE_ID, total_bytes=delta)
+    result = await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[FeedbackArchiveUsage.id],
+            set_={"total_bytes": FeedbackArchiveUsage.total_bytes + stmt.excluded.total_bytes}
+        )
+        .returning(FeedbackArchiveUsage.total_bytes)
+    )
+    
+    return result.scalar_one()
+
+
+# Удаляем самые давно полученные ответы (по индексу fetched_at), пока не освободится excess байт
+async def _evict_archive(session: AsyncSession, excess: int) -> int:
+    freed = 0
+    
+    while freed < excess:
+        oldest = (await session.execute(
+            sa.select(FeedbackArchive.imtId, FeedbackArchive.size_bytes)
+            .order_by(FeedbackArchive.fetched_at)
+            .limit(_ARCHIVE_EVICT_BATCH)
+        )).all()
+        
+        if not oldest:
+            break
+        
+        victims, planned = [], freed
+        for imtId, size_bytes in oldest:
+            if planned >= excess:
+                break
+            
+            victims.append(imtId)
+            planned += size_bytes
+            
+        # Учитываем только реально удалённые строки: параллельный процесс мог вытеснить их раньше
+        deleted = await session.execute(
+            sa.delete(FeedbackArchive)
+            .where(FeedbackArchive.imtId == sa.any_(
+                sa.bindparam("victim_ids", victims, type_=ARRAY(sa.Integer))
+            ))
+            .returning(FeedbackArchive.size_bytes)
+        )
+        freed += sum(deleted.scalars().all())
+        
+    return freed
+
+
+# Сохраняем сжатый ответ и вытесняем самые старые записи сверх ARCHIVE_MAX_BYTES
+@connection
+async def sql_put_archive(
+    imtId: int,
+    payload: bytes,
+    etag: Optional[str],
+    last_modified: Optional[str],
+    session: AsyncSession
+):
+    try:
+        # Запись одного imtId сериализуется, чтобы прежний размер и новый учитывались в счётчике ровно один раз
+        await session.execute(sa.select(sa.func.pg_advisory_xact_lock(ARCHIVE_LOCK_NAMESPACE, imtId)))
+        previous = await session.scalar(
+            sa.select(FeedbackArchive.size_bytes).where(FeedbackArchive.imtId == imtId)
+        )
+        
+        values = {
+            "imtId": imtId,
+            "payload": payload,
+            "size_bytes": len(payload),
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": datetime.now(timezone.utc)
+        }
+        
+        stmt = insert(FeedbackArchive).values(values)
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[FeedbackArchive.imtId],
+                set_={name: stmt.excluded[name] for name in values if name != "imtId"}
+            )
+        )
+        
+        # Вытесняем только при превышении лимита: размер архива берётся из счётчика, а не суммой по таблице
+        total = await _add_archive_usage(session, len(payload) - (previous or 0))
+        if total > config.ARCHIVE_MAX_BYTES:
+            freed = await _evict_archive(session, total - config.ARCHIVE_MAX_BYTES)
+            
+            if freed:
+                await _add_archive_usage(session, -freed)
+        
+        await session.commit()
+    
+    except SQLAlchemyError as e:
+        config.logger.error("Database error writing feedback archive for imtId %s: %s", imtId, e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error")
+        
+    except Exception as e:
+        config.logger.error("Unexpected error writing feedback archive for imtId %s: %s", imtId, e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unexpected server error")
+
+
+# Ответ 304: архивная копия подтверждена, обновляем время получения
+@connection
+async def sql_touch_archive(imtId: int, session: AsyncSession):
+    try:
+        await session.execute(
+            sa.update(FeedbackArchive)
+            .where(FeedbackArchive.imtId == imtId)
+            .values(fetched_at=datetime.now(timezone.utc))
+        )
+        await session.commit()
+    
+    except SQLAlchemyError as e:
+        config.logger.error("Database error touching feedback archive for imtId %s: %s", imtId, e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error")
+        
+    except Exception as e:
+        config.logger.error("Unexpected error touching feedback archive for imtId %s: %s", imtId, e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unexpected server error")
+
+
+# Берём токен из общего бюджета key. Если токенов нет, место в очереди всё равно резервируется:
+# возвращаем, сколько секунд подождать до своей очереди (0 - можно сразу)
+@connection
+async def sql_take_rate_token(key: str, rate: float, burst: float, session: AsyncSession) -> float:
+    try:
+        now = sa.func.clock_timestamp()
+        refilled = sa.func.least(
+            burst,
+            RateBudget.tokens + sa.extract("epoch", now - RateBudget.updated_at) * rate
+        )
+        
+        stmt = insert(RateBudget).values(key=key, tokens=burst - 1, updated_at=now)
+        result = await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[RateBudget.key],
+                set_={"tokens": refilled - 1, "updated_at": now}
+            )
+            .returning(RateBudget.tokens)
+        )
+        tokens = result.scalar_one()
+        await session.commit()
+        
+        return max(-tokens / rate, 0.0)
+    
+    except SQLAlchemyError as e:
+        config.logger.error("Database error taking rate token for %s: %s", key, e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error")
+        
+    except Exception as e:
+        config.logger.error("Unexpected error taking rate token for %s: %s", key, e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unexpected server error")
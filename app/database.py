@@ -1,21 +1,147 @@
 # Внешние зависимости
+from sqlalchemy import insert, select, text
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+import time
 # Внутренние модули
 from app.config import get_config
-from app.models import Base
+from app.metrics import DB_POOL_CHECKOUT_SECONDS, DB_POOL_SIZE, DB_POOL_CHECKED_OUT, DB_POOL_OVERFLOW
+from app.models import Base, SchemaVersion, SEARCH_VECTOR_SQL, STATS_RATING, STATS_DAY, STATS_COUNTRY
 
 
 # Получаем конфиг
 config = get_config()
 
-engine = create_async_engine(config.DATABASE_URL)
+
+# Пул соединений, измеряющий ожидание свободного соединения
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        started = time.perf_counter()
+        
+        try:
+            return super()._do_get()
+        
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started)
+            self.report_usage()
+            
+            
+    def _do_return_conn(self, record):
+        try:
+            super()._do_return_conn(record)
+            
+        finally:
+            self.report_usage()
+            
+            
+    # Загрузка пула пишется при выдаче и возврате соединения: в режиме нескольких процессов
+    # значение, вычисляемое в момент сбора, было бы видно только в процессе, принявшем scrape
+    def report_usage(self):
+        DB_POOL_SIZE.set(self.size())
+        DB_POOL_CHECKED_OUT.set(self.checkedout())
+        DB_POOL_OVERFLOW.set(max(self.overflow(), 0))
+
+
+# Пул на процесс: при нескольких воркерах размер делится в пределах бюджета DB_MAX_CONNECTIONS
+pool_size, max_overflow = config.db_pool_limits()
+engine = create_async_engine(
+    config.DATABASE_URL,
+    poolclass=TimedQueuePool,
+    pool_size=pool_size,
+    max_overflow=max_overflow,
+    pool_timeout=config.DB_POOL_TIMEOUT,
+    pool_recycle=config.DB_POOL_RECYCLE
+)
 AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
+engine.pool.report_usage()
+
+
+# Идемпотентные изменения схемы для уже созданных таблиц. Каждое выполняется один раз и отмечается
+# в schema_version по номеру позиции, поэтому новые изменения добавляются только в конец списка
+SCHEMA_UPGRADES = [
+    # Несколько артикулов (цвета, размеры) могут иметь общий imtId
+    'ALTER TABLE products DROP CONSTRAINT IF EXISTS "products_imtId_key"',
+    'CREATE INDEX IF NOT EXISTS "ix_products_imtId" ON products ("imtId")',
+    # Идентификатор отзыва Wildberries для инкрементальной записи
+    'ALTER TABLE bad_reviews ADD COLUMN IF NOT EXISTS wb_id VARCHAR(64)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS uq_review_wb_id ON bad_reviews (product_id, wb_id)',
+    # Дедупликация по md5-дайджесту в пределах товара вместо глобального индекса (text, pros, cons)
+    'ALTER TABLE bad_reviews ADD COLUMN IF NOT EXISTS content_digest BYTEA',
+    "UPDATE bad_reviews SET content_digest = decode(md5(text || chr(31) || pros || chr(31) || cons), 'hex') "
+    "WHERE content_digest IS NULL",
+    'ALTER TABLE bad_reviews ALTER COLUMN content_digest SET NOT NULL',
+    'CREATE UNIQUE INDEX IF NOT EXISTS uq_review_content_digest_legacy ON bad_reviews (product_id, content_digest) '
+    'WHERE wb_id IS NULL',
+    # Отзывы с wb_id не уникальны по содержимому: одинаковые отзывы без текста - разные отзывы
+    'DROP INDEX IF EXISTS uq_review_content_digest',
+    'ALTER TABLE bad_reviews DROP CONSTRAINT IF EXISTS uq_review_content',
+    # Отметки времени для планировщика обновлений
+    'ALTER TABLE products ADD COLUMN IF NOT EXISTS last_parsed_at TIMESTAMP WITH TIME ZONE',
+    'ALTER TABLE products ADD COLUMN IF NOT EXISTS last_changed_at TIMESTAMP WITH TIME ZONE',
+    'CREATE INDEX IF NOT EXISTS ix_products_last_parsed_at ON products (last_parsed_at)',
+    # Товары, для которых хранятся все отзывы, а пороги применяются при чтении
+    'ALTER TABLE products ADD COLUMN IF NOT EXISTS stores_all BOOLEAN NOT NULL DEFAULT false',
+    # Индексы для постраничного чтения и фильтров
+    'CREATE INDEX IF NOT EXISTS ix_bad_reviews_product_updated_id ON bad_reviews (product_id, "updatedDate", id)',
+    'CREATE INDEX IF NOT EXISTS ix_bad_reviews_product_rating_updated ON bad_reviews (product_id, rating, "updatedDate")',
+    'CREATE INDEX IF NOT EXISTS ix_bad_reviews_product_country_updated ON bad_reviews (product_id, country, "updatedDate")',
+    # Инкрементальная выгрузка по updatedDate
+    'CREATE INDEX IF NOT EXISTS ix_bad_reviews_updated ON bad_reviews ("updatedDate")',
+    # Полнотекстовый поиск: генерируемый tsvector и GIN-индекс
+    f'ALTER TABLE bad_reviews ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ({SEARCH_VECTOR_SQL}) STORED',
+    'CREATE INDEX IF NOT EXISTS ix_bad_reviews_search ON bad_reviews USING gin (search_vector)',
+    # Статистика отзывов: один раз заполняется по уже сохранённым отзывам, дальше ведётся при записи
+    "INSERT INTO review_stats_buckets (product_id, dimension, bucket, count) "
+    f"SELECT product_id, '{STATS_RATING}', rating::text, count(*) FROM bad_reviews "
+    "WHERE NOT EXISTS (SELECT 1 FROM product_stats) GROUP BY product_id, rating "
+    "UNION ALL "
+    f"SELECT product_id, '{STATS_DAY}', to_char(\"createdDate\" AT TIME ZONE 'UTC', 'YYYY-MM-DD'), count(*) FROM bad_reviews "
+    "WHERE NOT EXISTS (SELECT 1 FROM product_stats) GROUP BY product_id, 3 "
+    "UNION ALL "
+    f"SELECT product_id, '{STATS_COUNTRY}', country, count(*) FROM bad_reviews "
+    "WHERE NOT EXISTS (SELECT 1 FROM product_stats) GROUP BY product_id, country "
+    "ON CONFLICT DO NOTHING",
+    'INSERT INTO product_stats (product_id, reviews_count, first_review_at, last_review_at) '
+    'SELECT product_id, count(*), min("createdDate"), max("createdDate") FROM bad_reviews '
+    'WHERE NOT EXISTS (SELECT 1 FROM product_stats) GROUP BY product_id '
+    'ON CONFLICT DO NOTHING',
+    # Счётчик размера архива по уже сохранённым ответам
+    'INSERT INTO feedback_archive_usage (id, total_bytes) '
+    'SELECT 1, COALESCE(sum(size_bytes), 0) FROM feedback_archive '
+    'ON CONFLICT DO NOTHING',
+    # Задержка перед повтором задачи парсинга
+    'ALTER TABLE parse_jobs ADD COLUMN IF NOT EXISTS not_before TIMESTAMP WITH TIME ZONE',
+    # Отложенный повтор фонового обновления после ошибки
+    'ALTER TABLE products ADD COLUMN IF NOT EXISTS refresh_failures INTEGER NOT NULL DEFAULT 0',
+    'ALTER TABLE products ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMP WITH TIME ZONE',
+]
+
+
+# Ключ advisory-блокировки миграции: одновременно стартующие процессы применяют схему по очереди
+MIGRATION_LOCK_KEY = 0x4D49475241544531
+
 
 # Инициализируем таблицы
 async def setup_database():
     async with engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
         await conn.run_sync(Base.metadata.create_all)
+        
+        # ALTER TABLE и заполнение колонок не повторяются при каждом старте
+        applied = set((await conn.execute(select(SchemaVersion.version))).scalars().all())
+        pending = [
+            (version, statement)
+            for version, statement in enumerate(SCHEMA_UPGRADES, start=1)
+            if version not in applied
+        ]
+        
+        for version, statement in pending:
+            await conn.execute(text(statement))
+            await conn.execute(insert(SchemaVersion).values(version=version))
+            
+        if pending:
+            config.logger.info("Applied %s schema upgrades", len(pending))
             
 
 # Декоратор подключения к базе данных         
@@ -0,0 +1,126 @@
+# Внешние зависимости
+import csv
+import io
+from typing import Any, AsyncIterator, Dict, List
+# Внутренние модули
+from app.serialization import EXPORT_FIELDS, dumps
+
+
+# Форматы выгрузки: (media type, расширение файла)
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet")
+}
+
+
+# Проверяем, доступен ли Parquet (нужен пакет pyarrow)
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+        
+    except ImportError:
+        return False
+        
+    return True
+
+
+async def _ndjson(chunks: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    async for rows in chunks:
+        yield b"".join(dumps(row) + b"\n" for row in rows)
+
+
+async def _csv(chunks: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    
+    async for rows in chunks:
+        for row in rows:
+            writer.writerow([
+                value.isoformat() if hasattr(value, "isoformat") else value
+                for value in row.values()
+            ])
+            
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate(0)
+        
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+# Приёмник для ParquetWriter: отдаёт записанные байты по частям, позиция считается от начала файла
+class _ChunkSink:
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+        self.closed = False
+        
+        
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+        
+        
+    def tell(self) -> int:
+        return self.position
+        
+        
+    def flush(self):
+        pass
+        
+        
+    def close(self):
+        self.closed = True
+        
+        
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+# Каждая пачка строк - отдельная row group, байты уходят клиенту сразу после записи
+async def _parquet(chunks: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    timestamp = pa.timestamp("us", tz="UTC")
+    schema = pa.schema([
+        ("article", pa.int64()),
+        ("imtId", pa.int64()),
+        ("id", pa.int64()),
+        ("product_id", pa.int64()),
+        ("wb_id", pa.string()),
+        ("rating", pa.int32()),
+        ("country", pa.string()),
+        ("name", pa.string()),
+        ("text", pa.string()),
+        ("pros", pa.string()),
+        ("cons", pa.string()),
+        ("createdDate", timestamp),
+        ("updatedDate", timestamp)
+    ])
+    
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd")
+    
+    try:
+        async for rows in chunks:
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            yield sink.take()
+            
+    finally:
+        writer.close()
+        
+    yield sink.take()
+
+
+# Поток байтов выгрузки в заданном формате
+def encode_export(chunks: AsyncIterator[List[Dict[str, Any]]], export_format: str) -> AsyncIterator[bytes]:
+    encoders = {"ndjson": _ndjson, "csv": _csv, "parquet": _parquet}
+    
+    return encoders[export_format](chunks)
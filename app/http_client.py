@@ -0,0 +1,170 @@
+# Внешние зависимости
+import asyncio
+import httpx
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+# Внутренние модули
+from app.config import get_config
+from app.metrics import UPSTREAM_RESPONSES
+from app.ratelimit import CircuitOpenError, backoff_delay, get_host_guard, parse_retry_after
+
+
+config = get_config()
+
+# Статусы, при которых запрос повторяется
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+_client: Optional[httpx.AsyncClient] = None
+_host_limits: Dict[str, asyncio.Semaphore] = {}
+
+
+# Проверяем, доступен ли HTTP/2 (нужен пакет h2)
+def _http2_available() -> bool:
+    if not config.HTTP2:
+        return False
+    
+    try:
+        import h2  # noqa: F401
+        
+    except ImportError:
+        config.logger.warning("HTTP2 is enabled but package 'h2' is not installed, falling back to HTTP/1.1")
+        return False
+        
+    return True
+
+
+# Собираем клиент с настройками пула из конфига
+def _build_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=config.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=config.HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(config.HTTP_TIMEOUT, connect=config.HTTP_CONNECT_TIMEOUT),
+        http2=_http2_available()
+    )
+
+
+# Создаём общий пул соединений для запросов к Wildberries
+async def open_http_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = _build_client()
+        config.logger.info("HTTP client initialized")
+        
+    return _client
+
+
+# Закрываем пул соединений
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        config.logger.info("HTTP client closed")
+        
+    _host_limits.clear()
+
+
+# Возвращаем общий клиент (создаётся лениво, если lifespan не запускался)
+def get_http_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = _build_client()
+        
+    return _client
+
+
+# Ограничение одновременных соединений на один хост
+def _host_limit(host: str) -> asyncio.Semaphore:
+    semaphore = _host_limits.get(host)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(config.HTTP_MAX_PER_HOST)
+        _host_limits[host] = semaphore
+        
+    return semaphore
+
+
+# Отправляет запрос с учётом лимитов хоста: token bucket, circuit breaker и повторы с джиттером.
+# Ответы 429/5xx после исчерпания повторов возвращаются как есть
+async def _send(url: str, stream: bool = False, hold_limit: bool = True, **kwargs) -> httpx.Response:
+    host = httpx.URL(url).host
+    guard = get_host_guard(host)
+    client = get_http_client()
+    
+    for attempt in range(config.UPSTREAM_MAX_RETRIES + 1):
+        last_attempt = attempt == config.UPSTREAM_MAX_RETRIES
+        
+        try:
+            probe = await guard.acquire()
+            
+        except CircuitOpenError:
+            UPSTREAM_RESPONSES.labels(host=host, status="circuit_open").inc()
+            raise
+        
+        try:
+            request = client.build_request("GET", url, **kwargs)
+            
+            if hold_limit:
+                async with _host_limit(host):
+                    response = await client.send(request, stream=stream)
+            else:
+                response = await client.send(request, stream=stream)
+                
+        except (httpx.TimeoutException, httpx.NetworkError) as e:
+            UPSTREAM_RESPONSES.labels(host=host, status=type(e).__name__).inc()
+            guard.record_failure()
+            
+            if last_attempt:
+                raise
+            
+            config.logger.info("Retrying %s after %s (attempt %s)", host, type(e).__name__, attempt + 1)
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+            
+        # Отмена (проигравший хеджированный запрос) или неожиданная ошибка не должны оставлять пробу занятой
+        except BaseException:
+            if probe:
+                guard.release_probe()
+            raise
+        
+        UPSTREAM_RESPONSES.labels(host=host, status=str(response.status_code)).inc()
+        
+        if response.status_code not in RETRYABLE_STATUSES:
+            guard.record_success()
+            return response
+        
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        
+        if response.status_code == 429:
+            guard.record_throttled(retry_after, probe=probe)
+        else:
+            guard.record_failure()
+            
+        if last_attempt:
+            return response
+        
+        if stream:
+            await response.aclose()
+        
+        config.logger.info("Retrying %s after HTTP %s (attempt %s)", host, response.status_code, attempt + 1)
+        await asyncio.sleep(backoff_delay(attempt, retry_after))
+
+
+# GET-запрос через общий клиент с учётом лимитов хоста
+async def upstream_get(url: str, **kwargs) -> httpx.Response:
+    return await _send(url, **kwargs)
+
+
+# Потоковый GET-запрос: тело ответа читается по частям внутри контекста
+@asynccontextmanager
+async def upstream_stream(url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+    async with _host_limit(httpx.URL(url).host):
+        response = await _send(url, stream=True, hold_limit=False, **kwargs)
+        
+        try:
+            yield response
+            
+        finally:
+            await response.aclose()
@@ -0,0 +1,127 @@
+# Внешние зависимости
+import asyncio
+import random
+from fastapi import HTTPException, status
+from typing import List
+# Внутренние модули
+from app.config import get_config
+from app.crud import sql_claim_job, sql_finish_job
+from app.models import ParseJob
+from app.parser import parse_and_write
+from app.tracing import trace
+
+
+config = get_config()
+
+
+# Пул асинхронных воркеров, разбирающих очередь задач из таблицы parse_jobs
+class JobWorkerPool:
+    def __init__(self, workers: int):
+        self._workers = workers
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._running = False
+        
+        
+    def start(self):
+        if self._running:
+            return
+        
+        self._running = True
+        self._tasks = [asyncio.create_task(self._worker(index)) for index in range(self._workers)]
+        config.logger.info("Started %s parse job workers", self._workers)
+        
+        
+    async def stop(self):
+        self._running = False
+        self._wakeup.set()
+        
+        for task in self._tasks:
+            task.cancel()
+            
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        
+        
+    # Будим воркеры сразу после постановки задачи, не дожидаясь опроса
+    def notify(self):
+        self._wakeup.set()
+        
+        
+    async def _worker(self, index: int):
+        while self._running:
+            try:
+                job = await sql_claim_job()
+                
+            except Exception as e:
+                config.logger.error("Job worker %s failed to claim a job: %s", index, e)
+                job = None
+            
+            if job is None:
+                self._wakeup.clear()
+                
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=config.JOB_POLL_INTERVAL)
+                    
+                except asyncio.TimeoutError:
+                    pass
+                
+                continue
+            
+            # Ошибка одной задачи не должна останавливать воркер
+            try:
+                with trace(f"job-{job.id}"):
+                    await self._run(job)
+                    
+            except Exception as e:
+                config.logger.error("Job worker %s failed on parse job %s: %s", index, job.id, e)
+            
+            
+    # Экспоненциальная задержка перед повтором с джиттером
+    @staticmethod
+    def _retry_delay(attempts: int) -> float:
+        delay = min(config.JOB_RETRY_BACKOFF_MAX, config.JOB_RETRY_BACKOFF_BASE * 2 ** max(attempts - 1, 0))
+        return random.uniform(delay / 2, delay)
+        
+        
+    # Ошибка записи результата не теряет задачу: после истечения аренды её заберут повторно
+    async def _finish(self, job: ParseJob, **kwargs):
+        try:
+            await sql_finish_job(job_id=job.id, **kwargs)
+            
+        except Exception as e:
+            config.logger.error("Failed to finish parse job %s: %s", job.id, e)
+            
+            
+    async def _run(self, job: ParseJob):
+        try:
+            imtId, written = await parse_and_write(
+                article=job.article,
+                rating_stars=job.rating_stars,
+                days_passed=job.days_passed
+            )
+            
+        except HTTPException as e:
+            # Ошибки Wildberries и БД повторяем, пока не кончатся попытки
+            retry = e.status_code >= 500 and job.attempts < config.JOB_MAX_ATTEMPTS
+            config.logger.warning("Parse job %s for article %s failed (%s), retry=%s", job.id, job.article, e.status_code, retry)
+            await self._finish(job, error=e, retry=retry, retry_delay=self._retry_delay(job.attempts) if retry else 0)
+            
+        except Exception as e:
+            config.logger.error("Unexpected error in parse job %s: %s", job.id, e)
+            await self._finish(
+                job,
+                error=HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unexpected server error")
+            )
+            
+        else:
+            await self._finish(job, result={
+                "imtId": imtId,
+                "added": written["added"],
+                "updated": written["updated"],
+                "removed": written["removed"],
+                "reviews_count": len(written["reviews"])
+            })
+
+
+job_pool = JobWorkerPool(workers=config.JOB_WORKERS)
@@ -1,15 +1,143 @@
 # Внешние зависимости
+import atexit
+import json
 import logging
+import queue
 import sys
-from typing import Optional
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Tuple
+# Внутренние модули
+from app.metrics import LOG_RECORDS_DISCARDED
+from app.tracing import current_article, current_trace
+
+
+# Стандартные атрибуты LogRecord; всё остальное (extra, контекст) попадает в JSON отдельными полями
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_listeners: List[QueueListener] = []
+
+
+# Одна JSON-строка на запись
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and value is not None:
+                data[key] = value
+                
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+            
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+# Текстовый формат: id запроса и число пропущенных повторов дописываются к сообщению
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        
+        if getattr(record, "request_id", None):
+            line = f"{line} [request_id={record.request_id}]"
+        if getattr(record, "suppressed", None):
+            line = f"{line} (suppressed {record.suppressed} repeats)"
+            
+        return line
+
+
+# Контекст запроса берётся в момент вызова логгера, пока запись ещё в задаче-источнике
+class ContextFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = current_trace()
+        record.request_id = context.request_id if context is not None else None
+        record.article = current_article()
+        return True
+
+
+# Повторы одного шаблона сообщения (WARNING и выше): не больше burst за window секунд,
+# число пропущенных добавляется к первой записи следующего окна
+class RepeatLimitFilter(logging.Filter):
+    def __init__(self, burst: int, window: float, level: int = logging.WARNING):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.level = level
+        self._windows: Dict[Tuple[str, int, str], List[float]] = {}
+        self._lock = threading.Lock()
+        
+        
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.burst <= 0 or record.levelno < self.level:
+            return True
+            
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        
+        with self._lock:
+            state = self._windows.get(key)
+            
+            if state is None or now - state[0] >= self.window:
+                self._windows[key] = [now, 1, 0]
+                if state is not None and state[2]:
+                    record.suppressed = int(state[2])
+                    
+                return True
+                
+            state[1] += 1
+            if state[1] <= self.burst:
+                return True
+                
+            state[2] += 1
+            
+        LOG_RECORDS_DISCARDED.labels(reason="suppressed").inc()
+        return False
+
+
+# Запись только кладётся в очередь: форматирование и вывод - в потоке QueueListener.
+# При переполнении очереди запись отбрасывается, event loop не ждёт stdout
+class NonBlockingQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+        
+        
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+            
+        except queue.Full:
+            LOG_RECORDS_DISCARDED.labels(reason="dropped").inc()
+
+
+# Дописываем очереди при завершении процесса
+def _stop_listeners():
+    for listener in _listeners:
+        try:
+            listener.stop()
+            
+        except queue.Full:
+            pass
+            
+    _listeners.clear()
 
 
 def setup_logger(
     name: str = __name__,
     level: str = "INFO",
-    format_str: str = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    format_str: str = '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    json_format: bool = True,
+    queue_size: int = 10000,
+    repeat_burst: int = 10,
+    repeat_window: float = 60
 ) -> logging.Logger:
-    
+
     logger = logging.getLogger(name)
     
     # Уровень
@@ -18,11 +146,23 @@ def setup_logger(
     
     if not logger.handlers:
         # Форматтер
-        formatter = logging.Formatter(format_str)
+        formatter = JsonFormatter() if json_format else TextFormatter(format_str)
         
-        # Обработчик для stdout
+        # Обработчик для stdout работает в отдельном потоке
         stdout_handler = logging.StreamHandler(sys.stdout)
         stdout_handler.setFormatter(formatter)
-        logger.addHandler(stdout_handler)
-    
-    return logger
\ No newline at end of file
+        
+        queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+        queue_handler.addFilter(RepeatLimitFilter(burst=repeat_burst, window=repeat_window))
+        queue_handler.addFilter(ContextFilter())
+        logger.addHandler(queue_handler)
+        
+        listener = QueueListener(queue_handler.queue, stdout_handler)
+        listener.start()
+        
+        if not _listeners:
+            atexit.register(_stop_listeners)
+            
+        _listeners.append(listener)
+        
+    return logger
@@ -1,19 +1,68 @@
 # Внешние зависимости
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import CONTENT_TYPE_LATEST
 # Внутренние модули
 from app.router import router
-from app.database import setup_database
+from app.database import engine, setup_database
+from app.http_client import open_http_client, close_http_client
+from app.parser import imtid_resolver
+from app.jobs import job_pool
+from app.scheduler import refresh_scheduler
+from app.cache import reviews_cache, REVIEWS_CACHE_CHANNEL
+from app.coordination import CacheInvalidationListener
+from app.metrics import mark_process_dead, render_metrics
+from app.middleware import RequestTraceMiddleware
+from app.config import get_config
+
+
+config = get_config()
+cache_listener = CacheInvalidationListener(reviews_cache, REVIEWS_CACHE_CHANNEL)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Создание таблиц (в режиме нескольких воркеров схема применяется заранее: python -m app.migrate)
+    if config.DB_AUTO_MIGRATE:
+        await setup_database()
+    # Общий пул соединений к Wildberries
+    await open_http_client()
+    # Сброс кэша ответов по записям из других процессов
+    cache_listener.start()
+    # Воркеры очереди задач парсинга
+    job_pool.start()
+    # Фоновое обновление отслеживаемых товаров
+    if config.SCHEDULER_ENABLED:
+        refresh_scheduler.start()
+    
+    yield
+    
+    await refresh_scheduler.stop()
+    await job_pool.stop()
+    await imtid_resolver.close()
+    await cache_listener.stop()
+    await close_http_client()
+    await engine.dispose()
+    mark_process_dead()
 
 
 app = FastAPI(
     title="Parser Reviews for Wildberries Backend API",
     description="Backend для приложения-парсера с Wildberries",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.include_router(router)
 
+
+# Метрики для Prometheus
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+
 # Настройка CORS
 app.add_middleware(
     CORSMiddleware,
@@ -23,8 +72,5 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-
-@app.on_event("startup")
-async def startup_event():
-    # Создание таблиц
-    await setup_database()
\ No newline at end of file
+# Id запроса и время этапов в логах
+app.add_middleware(RequestTraceMiddleware)
\ No newline at end of file
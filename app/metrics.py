@@ -0,0 +1,128 @@
+# Внешние зависимости
+import functools
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+# Внутренние модули
+from app.tracing import record_stage
+
+
+# Этапы parser_run: imtid_lookup, download, filter
+PARSE_STAGE_SECONDS = Histogram(
+    "wbparser_parse_stage_seconds",
+    "Duration of parse pipeline stages",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+
+FEEDBACK_PAYLOAD_BYTES = Histogram(
+    "wbparser_feedback_payload_bytes",
+    "Size of feedback responses downloaded from Wildberries",
+    buckets=tuple(1024 * 4 ** power for power in range(10))
+)
+
+# raw - отзывов в ответе Wildberries, kept - прошло фильтр
+PARSE_REVIEWS = Histogram(
+    "wbparser_parse_reviews",
+    "Number of reviews per parsed card",
+    ["kind"],
+    buckets=(0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 200000)
+)
+
+DB_OPERATION_SECONDS = Histogram(
+    "wbparser_db_operation_seconds",
+    "Duration of database operations",
+    ["operation"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+
+# status - HTTP-код ответа или имя исключения
+UPSTREAM_RESPONSES = Counter(
+    "wbparser_upstream_responses_total",
+    "Responses from Wildberries hosts",
+    ["host", "status"]
+)
+
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "wbparser_db_pool_checkout_seconds",
+    "Time spent waiting for a connection from the SQLAlchemy pool",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5, 30)
+)
+
+# При нескольких воркерах значения живых процессов суммируются
+DB_POOL_SIZE = Gauge("wbparser_db_pool_size", "Configured SQLAlchemy pool size", multiprocess_mode="livesum")
+DB_POOL_CHECKED_OUT = Gauge(
+    "wbparser_db_pool_checked_out", "Connections currently checked out of the pool", multiprocess_mode="livesum"
+)
+DB_POOL_OVERFLOW = Gauge(
+    "wbparser_db_pool_overflow", "Connections opened above the pool size", multiprocess_mode="livesum"
+)
+
+# dropped - очередь логов переполнена, suppressed - повтор сверх лимита
+LOG_RECORDS_DISCARDED = Counter(
+    "wbparser_log_records_discarded_total",
+    "Log records not written to the output",
+    ["reason"]
+)
+
+
+# Этап разбора: гистограмма PARSE_STAGE_SECONDS и время этапа в контексте запроса
+@contextmanager
+def timed_stage(stage: str) -> Iterator[None]:
+    started = time.perf_counter()
+    
+    try:
+        yield
+        
+    finally:
+        elapsed = time.perf_counter() - started
+        PARSE_STAGE_SECONDS.labels(stage=stage).observe(elapsed)
+        record_stage(stage, elapsed)
+
+
+# Декоратор: время выполнения корутины в гистограмме DB_OPERATION_SECONDS и в контексте запроса
+def timed_db_operation(operation: str) -> Callable:
+    histogram = DB_OPERATION_SECONDS.labels(operation=operation)
+    
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            
+            try:
+                return await func(*args, **kwargs)
+            
+            finally:
+                elapsed = time.perf_counter() - started
+                histogram.observe(elapsed)
+                record_stage(f"db_{operation}", elapsed)
+        
+        return wrapper
+    
+    return decorator
+
+
+# Режим нескольких процессов: каждый воркер пишет метрики в файлы каталога PROMETHEUS_MULTIPROC_DIR.
+# Как и prometheus_client, считаем режим включённым по наличию переменной, даже пустой
+def multiprocess_enabled() -> bool:
+    return "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+
+# Текст метрик в формате Prometheus. При нескольких воркерах метрики собираются из файлов всех процессов,
+# иначе каждый scrape возвращал бы счётчики того воркера, который принял запрос
+def render_metrics() -> bytes:
+    if not multiprocess_enabled():
+        return generate_latest()
+    
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+# Остановленный воркер больше не учитывается в livesum-метриках
+def mark_process_dead():
+    if multiprocess_enabled():
+        multiprocess.mark_process_dead(os.getpid())
+
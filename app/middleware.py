@@ -0,0 +1,65 @@
+# Внешние зависимости
+import time
+from typing import Awaitable, Callable, MutableMapping, Any
+# Внутренние модули
+from app.config import get_config
+from app.tracing import trace
+
+
+config = get_config()
+
+Scope = MutableMapping[str, Any]
+Message = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+
+
+# ASGI-middleware: id запроса (из X-Request-ID или новый) в контексте логов и в ответе,
+# по завершении - одна запись с длительностью и временем этапов
+class RequestTraceMiddleware:
+    def __init__(self, app: Callable):
+        self.app = app
+        
+        
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")[:64] or None
+                break
+            
+        status_code = 500
+        
+        with trace(request_id) as context:
+            async def send_with_request_id(message: Message):
+                nonlocal status_code
+                
+                if message["type"] == "http.response.start":
+                    status_code = message["status"]
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-request-id", context.request_id.encode("latin-1"))
+                    ]
+                    
+                await send(message)
+                
+            try:
+                await self.app(scope, receive, send_with_request_id)
+                
+            finally:
+                duration_ms = (time.perf_counter() - context.started) * 1000
+                level = "info" if duration_ms >= config.LOG_SLOW_REQUEST_MS else "debug"
+                
+                getattr(config.logger, level)(
+                    "%s %s -> %s in %.1f ms",
+                    scope["method"], scope["path"], status_code, duration_ms,
+                    extra={
+                        "duration_ms": round(duration_ms, 2),
+                        "status": status_code,
+                        "stages_ms": context.stages_ms(),
+                        "request_article": context.article
+                    }
+                )
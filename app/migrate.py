@@ -0,0 +1,22 @@
+# Разовое применение схемы БД перед запуском воркеров: python -m app.migrate
+# Внешние зависимости
+import asyncio
+# Внутренние модули
+from app.config import get_config
+from app.database import engine, setup_database
+
+
+config = get_config()
+
+
+async def migrate():
+    try:
+        await setup_database()
+        config.logger.info("Database schema is up to date")
+        
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,107 @@
+# Внешние зависимости
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+# Внутренние модули
+from app.config import get_config
+
+
+config = get_config()
+
+# Зеркала отзывов в порядке предпочтения по умолчанию
+DEFAULT_FEEDBACK_MIRRORS = [
+    "https://feedbacks1.wb.ru/feedbacks/v2/{imtId}",
+    "https://feedbacks2.wb.ru/feedbacks/v2/{imtId}",
+    "https://feedbacks1.wb.ru/feedbacks/v1/{imtId}",
+    "https://feedbacks2.wb.ru/feedbacks/v1/{imtId}"
+]
+
+FEEDBACK_MIRRORS = config.WB_FEEDBACK_MIRRORS or DEFAULT_FEEDBACK_MIRRORS
+
+# Вес нового замера в скользящей средней задержки
+EWMA_ALPHA = 0.3
+
+
+# Статистика одного зеркала
+@dataclass
+class MirrorStats:
+    requests: int = 0
+    errors: int = 0
+    consecutive_errors: int = 0
+    latency_ewma: Optional[float] = None
+    last_error_at: float = 0.0
+    
+    
+    def record_latency(self, latency: float):
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma = EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.latency_ewma
+            
+            
+    # Отменённый запрос (проигравший в гонке) даёт только оценку снизу: он стартовал позже победителя
+    # и был прерван, поэтому может лишь поднять среднюю, но не опустить её
+    def record_lower_bound(self, elapsed: float):
+        if self.latency_ewma is not None and elapsed > self.latency_ewma:
+            self.record_latency(elapsed)
+            
+            
+    def record_success(self, latency: float):
+        self.requests += 1
+        self.consecutive_errors = 0
+        self.record_latency(latency)
+            
+            
+    def record_error(self):
+        self.requests += 1
+        self.errors += 1
+        self.consecutive_errors += 1
+        self.last_error_at = time.monotonic()
+        
+        
+    # Зеркало считается нездоровым, пока не истёк cooldown после последней ошибки
+    @property
+    def healthy(self) -> bool:
+        if self.consecutive_errors == 0:
+            return True
+        
+        return time.monotonic() - self.last_error_at > config.MIRROR_FAILURE_COOLDOWN
+        
+        
+_stats: Dict[str, MirrorStats] = {mirror: MirrorStats() for mirror in FEEDBACK_MIRRORS}
+
+
+def get_mirror_stats(mirror: str) -> MirrorStats:
+    return _stats.setdefault(mirror, MirrorStats())
+
+
+# Зеркала по убыванию приоритета: сначала здоровые, затем самые быстрые
+def ordered_mirrors() -> List[str]:
+    measured = [
+        stats.latency_ewma for stats in map(get_mirror_stats, FEEDBACK_MIRRORS)
+        if stats.latency_ewma is not None
+    ]
+    worst = max(measured, default=0.0)
+    
+    def key(item):
+        index, mirror = item
+        stats = get_mirror_stats(mirror)
+        # Зеркала без замеров идут после измеренных здоровых: считаем их не быстрее самого медленного
+        unmeasured = stats.latency_ewma is None
+        latency = worst if unmeasured else stats.latency_ewma
+        return (not stats.healthy, latency, unmeasured, index)
+    
+    return [mirror for _, mirror in sorted(enumerate(FEEDBACK_MIRRORS), key=key)]
+
+
+# Снимок статистики для логов и метрик
+def mirror_stats_snapshot() -> Dict[str, dict]:
+    return {
+        mirror: {
+            "requests": stats.requests,
+            "errors": stats.errors,
+            "latency_ewma": stats.latency_ewma,
+            "healthy": stats.healthy
+        }
+        for mirror, stats in _stats.items()
+    }
@@ -1,8 +1,12 @@
 # Внешние зависимости
 from sqlalchemy.ext.asyncio import AsyncAttrs, AsyncSession
+from sqlalchemy.dialects.postgresql import TSVECTOR
 import sqlalchemy.orm as so
 import sqlalchemy as sa
 from datetime import datetime
+import hashlib
+import json
+import zlib
 from typing import List, Optional
 
 
@@ -22,9 +26,17 @@ class Product(Base):
     
     id: so.Mapped[int] = so.mapped_column(sa.Integer, primary_key=True)
     article: so.Mapped[int] = so.mapped_column(sa.Integer, index=True, unique=True, nullable=False)
-    imtId: so.Mapped[int] = so.mapped_column(sa.Integer, unique=True, nullable=False)
+    imtId: so.Mapped[int] = so.mapped_column(sa.Integer, index=True, nullable=False)
     rating_stars: so.Mapped[int] = so.mapped_column(sa.Integer, default=3, nullable=False)
     days_passed:  so.Mapped[int] = so.mapped_column(sa.Integer, default=3, nullable=False)
+    # Когда товар последний раз парсился и когда в последний раз менялись его отзывы
+    last_parsed_at: so.Mapped[Optional[datetime]] = so.mapped_column(sa.DateTime(timezone=True), index=True, nullable=True)
+    last_changed_at: so.Mapped[Optional[datetime]] = so.mapped_column(sa.DateTime(timezone=True), nullable=True)
+    # Неудачные фоновые обновления подряд и момент, раньше которого товар не обновляется повторно
+    refresh_failures: so.Mapped[int] = so.mapped_column(sa.Integer, default=0, server_default="0", nullable=False)
+    next_attempt_at: so.Mapped[Optional[datetime]] = so.mapped_column(sa.DateTime(timezone=True), nullable=True)
+    # Сохранены все отзывы (INGEST_MODE=all): rating_stars/days_passed применяются при чтении
+    stores_all: so.Mapped[bool] = so.mapped_column(sa.Boolean, default=False, server_default=sa.false(), nullable=False)
     
     bad_reviews: so.Mapped[List["BadReview"]] = so.relationship(
         "BadReview", 
@@ -36,12 +48,23 @@ class Product(Base):
         return f'<Article {self.article}>'
         
     
+# Конфигурация полнотекстового поиска и выражение поискового вектора (колонка генерируется Postgres при записи).
+# Текст и недостатки весят больше достоинств: поиск нужен для тем жалоб
+SEARCH_CONFIG = "russian"
+SEARCH_VECTOR_SQL = (
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', text), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', cons), 'A') || "
+    f"setweight(to_tsvector('{SEARCH_CONFIG}', pros), 'C')"
+)
+
+
 # Модель плохихи отзывов
 class BadReview(Base):
     __tablename__ = "bad_reviews"
     
     id: so.Mapped[int] = so.mapped_column(sa.Integer, primary_key=True)
     product_id: so.Mapped[int] = so.mapped_column(sa.Integer, sa.ForeignKey('products.id'))
+    wb_id: so.Mapped[Optional[str]] = so.mapped_column(sa.String(64), nullable=True)
     rating: so.Mapped[int] = so.mapped_column(sa.Integer, nullable=False)
     country: so.Mapped[Optional[str]] = so.mapped_column(sa.String(10), nullable=False)
     name: so.Mapped[Optional[str]] = so.mapped_column(sa.String(100), nullable=False)
@@ -50,10 +73,30 @@ class BadReview(Base):
     cons: so.Mapped[str] = so.mapped_column(sa.Text, nullable=False)
     createdDate: so.Mapped[datetime] = so.mapped_column(sa.DateTime(timezone=True), nullable=False)
     updatedDate: so.Mapped[datetime] = so.mapped_column(sa.DateTime(timezone=True), nullable=False)
+    # md5(text, pros, cons) - компактный ключ дедупликации вместо индекса по трём Text
+    content_digest: so.Mapped[bytes] = so.mapped_column(sa.LargeBinary(16), nullable=False)
+    # Только для поиска: не загружается вместе с отзывом
+    search_vector: so.Mapped[Optional[str]] = so.mapped_column(
+        TSVECTOR, sa.Computed(SEARCH_VECTOR_SQL, persisted=True), deferred=True
+    )
     
-    # Составной уникальный индекс для предотвращения дубликатов отзывов
     __table_args__ = (
-        sa.UniqueConstraint('text', 'pros', 'cons', name='uq_review_content'),
+        # Уникальность содержимого в пределах товара - только для отзывов без wb_id:
+        # разные отзывы с одинаковым текстом (например, только оценка) различаются по wb_id
+        sa.Index(
+            'uq_review_content_digest_legacy', 'product_id', 'content_digest',
+            unique=True, postgresql_where=sa.text('wb_id IS NULL')
+        ),
+        # Стабильная идентичность отзыва внутри товара для инкрементальной записи
+        sa.Index('uq_review_wb_id', 'product_id', 'wb_id', unique=True),
+        # Keyset-пагинация по (updatedDate, id) и фильтры по рейтингу и стране
+        sa.Index('ix_bad_reviews_product_updated_id', 'product_id', 'updatedDate', 'id'),
+        sa.Index('ix_bad_reviews_product_rating_updated', 'product_id', 'rating', 'updatedDate'),
+        sa.Index('ix_bad_reviews_product_country_updated', 'product_id', 'country', 'updatedDate'),
+        # Инкрементальная выгрузка изменившихся отзывов по всем товарам
+        sa.Index('ix_bad_reviews_updated', 'updatedDate'),
+        # Полнотекстовый поиск по text, pros, cons
+        sa.Index('ix_bad_reviews_search', 'search_vector', postgresql_using='gin'),
     )
     
     product: so.Mapped["Product"] = so.relationship(
@@ -61,8 +104,160 @@ class BadReview(Base):
         back_populates="bad_reviews"
     )
     
+    # Дайджест и поисковый вектор - служебные поля, наружу не отдаются
+    def to_dict(self):
+        return {
+            c.name: getattr(self, c.name)
+            for c in self.__table__.columns
+            if c.name not in ("content_digest", "search_vector")
+        }
+    
+    # Должен совпадать с backfill-выражением в app/database.py
+    @staticmethod
+    def make_digest(text: str, pros: str, cons: str) -> bytes:
+        return hashlib.md5("\x1f".join((text, pros, cons)).encode("utf-8")).digest()
+    
     def __repr__(self):
         return f'<id {self.id}>'
+
+
+# Статусы задач парсинга
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+# Модель задач асинхронного парсинга
+class ParseJob(Base):
+    __tablename__ = "parse_jobs"
+    
+    id: so.Mapped[int] = so.mapped_column(sa.Integer, primary_key=True)
+    article: so.Mapped[int] = so.mapped_column(sa.Integer, nullable=False)
+    rating_stars: so.Mapped[int] = so.mapped_column(sa.Integer, nullable=False)
+    days_passed: so.Mapped[int] = so.mapped_column(sa.Integer, nullable=False)
+    status: so.Mapped[str] = so.mapped_column(sa.String(16), default=JOB_QUEUED, nullable=False)
+    attempts: so.Mapped[int] = so.mapped_column(sa.Integer, default=0, nullable=False)
+    result: so.Mapped[Optional[dict]] = so.mapped_column(sa.JSON, nullable=True)
+    error: so.Mapped[Optional[str]] = so.mapped_column(sa.Text, nullable=True)
+    error_code: so.Mapped[Optional[int]] = so.mapped_column(sa.Integer, nullable=True)
+    created_at: so.Mapped[datetime] = so.mapped_column(
+        sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False
+    )
+    started_at: so.Mapped[Optional[datetime]] = so.mapped_column(sa.DateTime(timezone=True), nullable=True)
+    finished_at: so.Mapped[Optional[datetime]] = so.mapped_column(sa.DateTime(timezone=True), nullable=True)
+    # Повтор после ошибки не забирается раньше этого момента
+    not_before: so.Mapped[Optional[datetime]] = so.mapped_column(sa.DateTime(timezone=True), nullable=True)
+    
+    __table_args__ = (
+        # Выборка следующей задачи воркером
+        sa.Index('ix_parse_jobs_status_id', 'status', 'id'),
+    )
+    
+    def __repr__(self):
+        return f'<ParseJob {self.id} {self.status}>'
+
+
+# Архив сырых ответов с отзывами по imtId: сжатое тело ответа и валидаторы для условных запросов
+class FeedbackArchive(Base):
+    __tablename__ = "feedback_archive"
+    
+    imtId: so.Mapped[int] = so.mapped_column(sa.Integer, primary_key=True)
+    payload: so.Mapped[bytes] = so.mapped_column(sa.LargeBinary, nullable=False)
+    size_bytes: so.Mapped[int] = so.mapped_column(sa.Integer, nullable=False)
+    etag: so.Mapped[Optional[str]] = so.mapped_column(sa.String(256), nullable=True)
+    last_modified: so.Mapped[Optional[str]] = so.mapped_column(sa.String(64), nullable=True)
+    fetched_at: so.Mapped[datetime] = so.mapped_column(sa.DateTime(timezone=True), index=True, nullable=False)
+    
+    @staticmethod
+    def pack(body: bytes, level: int) -> bytes:
+        return zlib.compress(body, level)
+    
+    def feedbacks(self) -> List[dict]:
+        return json.loads(zlib.decompress(self.payload)).get("feedbacks") or []
+    
+    # Заголовки условного запроса к Wildberries
+    def validators(self) -> dict:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+            
+        return headers
+    
+    def __repr__(self):
+        return f'<FeedbackArchive {self.imtId}>'
+
+
+# Суммарный размер архива (одна строка): ведётся при записи, чтобы вытеснение не сканировало архив целиком
+class FeedbackArchiveUsage(Base):
+    __tablename__ = "feedback_archive_usage"
     
+    id: so.Mapped[int] = so.mapped_column(sa.Integer, primary_key=True)
+    total_bytes: so.Mapped[int] = so.mapped_column(sa.BigInteger, nullable=False)
+    
+    def __repr__(self):
+        return f'<FeedbackArchiveUsage {self.total_bytes}>'
+
+
+# Общие для всех процессов бюджеты запросов (token bucket): сколько токенов осталось на момент updated_at
+class RateBudget(Base):
+    __tablename__ = "rate_budgets"
+    
+    key: so.Mapped[str] = so.mapped_column(sa.String(256), primary_key=True)
+    tokens: so.Mapped[float] = so.mapped_column(sa.Float, nullable=False)
+    updated_at: so.Mapped[datetime] = so.mapped_column(sa.DateTime(timezone=True), nullable=False)
+    
+    def __repr__(self):
+        return f'<RateBudget {self.key} {self.tokens:.2f}>'
+
+
+# Разрезы статистики отзывов товара
+STATS_RATING = "rating"
+STATS_DAY = "day"
+STATS_COUNTRY = "country"
+
+
+# Сводка по отзывам товара, обновляется в той же транзакции, что и отзывы
+class ProductStats(Base):
+    __tablename__ = "product_stats"
+    
+    product_id: so.Mapped[int] = so.mapped_column(sa.Integer, sa.ForeignKey('products.id', ondelete="CASCADE"), primary_key=True)
+    reviews_count: so.Mapped[int] = so.mapped_column(sa.Integer, default=0, nullable=False)
+    first_review_at: so.Mapped[Optional[datetime]] = so.mapped_column(sa.DateTime(timezone=True), nullable=True)
+    last_review_at: so.Mapped[Optional[datetime]] = so.mapped_column(sa.DateTime(timezone=True), nullable=True)
+    
+    def __repr__(self):
+        return f'<ProductStats {self.product_id} {self.reviews_count}>'
+
+
+# Количество отзывов товара в разрезе: рейтинг, день создания (YYYY-MM-DD, UTC) или страна
+class ReviewStatsBucket(Base):
+    __tablename__ = "review_stats_buckets"
+    
+    product_id: so.Mapped[int] = so.mapped_column(sa.Integer, sa.ForeignKey('products.id', ondelete="CASCADE"), primary_key=True)
+    dimension: so.Mapped[str] = so.mapped_column(sa.String(16), primary_key=True)
+    bucket: so.Mapped[str] = so.mapped_column(sa.String(32), primary_key=True)
+    count: so.Mapped[int] = so.mapped_column(sa.Integer, nullable=False)
+    
+    __table_args__ = (
+        # Статистика по каталогу и дневная динамика за период
+        sa.Index('ix_review_stats_buckets_dimension_bucket', 'dimension', 'bucket'),
+    )
     
-    
\ No newline at end of file
+    def __repr__(self):
+        return f'<ReviewStatsBucket {self.product_id} {self.dimension}={self.bucket}: {self.count}>'
+
+
+# Применённые изменения схемы: номер - позиция в SCHEMA_UPGRADES (app/database.py), начиная с 1
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+    
+    version: so.Mapped[int] = so.mapped_column(sa.Integer, primary_key=True, autoincrement=False)
+    applied_at: so.Mapped[datetime] = so.mapped_column(
+        sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False
+    )
+    
+    def __repr__(self):
+        return f'<SchemaVersion {self.version}>'
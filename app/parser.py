@@ -1,19 +1,46 @@
 # Внешние зависимости
+import asyncio
+import functools
+import time
 import httpx
+import ijson
+from contextlib import aclosing
+from dataclasses import dataclass
 from fastapi import HTTPException, status
-from typing import List, Tuple
+from typing import Any, List, Tuple, Dict, Union, Optional, Callable, Awaitable
 from datetime import datetime, timezone, timedelta
 # Внутренние модули
 from app.config import get_config
-from app.schemas import BadReviewSchem
+from app.crud import sql_get_archive, sql_put_archive, sql_touch_archive, sql_write_reviews
+from app.http_client import upstream_get, upstream_stream
+from app.metrics import FEEDBACK_PAYLOAD_BYTES, PARSE_REVIEWS, timed_stage
+from app.mirrors import get_mirror_stats, ordered_mirrors
+from app.models import FeedbackArchive
+from app.ratelimit import CircuitOpenError
+from app.resolver import ImtIdResolver
+from app.review_filter import ReviewFilter
+from app.schemas import BadReviewSchem, RequestReviewSchem
+from app.singleflight import SingleFlight
+from app.tracing import bind_article
 
 
 config = get_config()
 
+# Пороги, с которыми в режиме INGEST_MODE=all проходят все отзывы (оценки 1-5, любая дата)
+INGEST_ALL_RATING_STARS = 6
+INGEST_ALL_DAYS = 36500
+
+
+# Отзывы, проходящие пороги запроса: те же условия, что при чтении товара с хранением всех отзывов
+def apply_thresholds(reviews: List[Any], rating_stars: int, days_passed: int) -> List[Any]:
+    cutoff = datetime.now(timezone.utc) - timedelta(days=days_passed)
+    
+    return [review for review in reviews if review.rating < rating_stars and review.updatedDate >= cutoff]
+
 
 # Получает imtId по артикулу товара
 async def get_imtid_from_nmid(nm_id: int) -> int:
-    url = f"https://u-card.wb.ru/cards/v4/detail?appType=1&curr=rub&dest=-1185367&spp=30&ab_testing=false&lang=ru&nm={nm_id}"
+    url = f"{config.WB_CARD_URL}?appType=1&curr=rub&dest=-1185367&spp=30&ab_testing=false&lang=ru&nm={nm_id}"
     
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
@@ -23,67 +50,69 @@ async def get_imtid_from_nmid(nm_id: int) -> int:
     
     
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                url,
-                headers=headers,
-                timeout=10
+        response = await upstream_get(url, headers=headers)
+    
+        response.raise_for_status()
+        data = response.json()
+        
+        if not data or not isinstance(data, dict):
+            config.logger.warning("Invalid API response structure for nm_id %s", nm_id)
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail="Invalid response from Wildberries API"
             )
         
-            response.raise_for_status()
-            data = response.json()
-            
-            if not data or not isinstance(data, dict):
-                config.logger.warning(f"Invalid API response structure for nm_id {nm_id}")
-                raise HTTPException(
-                    status_code=status.HTTP_502_BAD_GATEWAY,
-                    detail="Invalid response from Wildberries API"
-                )
-            
-            products = data.get('products', [])
-            if not products:
-                config.logger.info(f"Product not found for nm_id {nm_id}")
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Product not found"
-                )
-            
-            imt_id = products[0].get('root')
-            if not imt_id:
-                config.logger.warning(f"imtId not found in product data for nm_id {nm_id}")
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="imtId not found for this product"
-                )
-                
-            config.logger.debug(f"Successfully got imtId {imt_id} for nm_id {nm_id}")
+        products = data.get('products', [])
+        if not products:
+            config.logger.info("Product not found for nm_id %s", nm_id)
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Product not found"
+            )
+        
+        imt_id = products[0].get('root')
+        if not imt_id:
+            config.logger.warning("imtId not found in product data for nm_id %s", nm_id)
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="imtId not found for this product"
+            )
             
-            return imt_id
+        config.logger.debug("Successfully got imtId %s for nm_id %s", imt_id, nm_id)
+        
+        return imt_id
       
       
     except httpx.TimeoutException:
-        config.logger.warning(f"Timeout while fetching imtId for nm_id {nm_id}")
+        config.logger.warning("Timeout while fetching imtId for nm_id %s", nm_id)
         raise HTTPException(
             status_code=status.HTTP_504_GATEWAY_TIMEOUT,
             detail="Request to Wildberries timed out"
         )
         
     except httpx.HTTPStatusError as e:
-        config.logger.error(f"HTTP error {e.response.status_code} for nm_id {nm_id}: {e}")
+        config.logger.error("HTTP error %s for nm_id %s: %s", e.response.status_code, nm_id, e)
         raise HTTPException(
             status_code=status.HTTP_502_BAD_GATEWAY,
             detail="Wildberries API returned error"
         )
         
     except httpx.RequestError as e:
-        config.logger.error(f"Network error for nm_id {nm_id}: {e}")
+        config.logger.error("Network error for nm_id %s: %s", nm_id, e)
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Network error connecting to Wildberries"
         )
         
+    except CircuitOpenError as e:
+        config.logger.warning("Skipping imtId request for nm_id %s: %s", nm_id, e)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Wildberries is temporarily unavailable"
+        )
+        
     except ValueError as e:
-        config.logger.error(f"JSON parsing error for nm_id {nm_id}: {e}")
+        config.logger.error("JSON parsing error for nm_id %s: %s", nm_id, e)
         raise HTTPException(
             status_code=status.HTTP_502_BAD_GATEWAY,
             detail="Invalid JSON response from Wildberries"
@@ -93,134 +122,489 @@ async def get_imtid_from_nmid(nm_id: int) -> int:
         raise e
         
     except Exception as e:
-        config.logger.error(f"Unexpected error getting imtId for nm_id {nm_id}: {e}")
+        config.logger.error("Unexpected error getting imtId for nm_id %s: %s", nm_id, e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Unexpected server error"
         )
         
 
-# Получает необработанные отзывы по imtId
-async def get_raw_reviews_from_imtid(nm_id: int, imtId: int) -> List[dict]:
-    feedback_servers = [
-        f"https://feedbacks1.wb.ru/feedbacks/v2/{imtId}",
-        f"https://feedbacks2.wb.ru/feedbacks/v2/{imtId}",
-        f"https://feedbacks1.wb.ru/feedbacks/v1/{imtId}",
-        f"https://feedbacks2.wb.ru/feedbacks/v1/{imtId}"
-    ]
+# Кэш article -> imtId, чтобы не ходить в card API за известными товарами
+imtid_resolver = ImtIdResolver(fetch=get_imtid_from_nmid)
+
+
+# Разбирает массив feedbacks по мере поступления байтов, фильтруя каждый отзыв сразу.
+# Байты читаются в этой задаче, а ijson получает их через push-интерфейс: при отмене проигравшего
+# хеджированного запроса итератор ответа закрывается здесь же, до response.aclose(), а не финализатором
+async def _stream_feedbacks(response: httpx.Response, review_filter: ReviewFilter) -> Optional[List[BadReviewSchem]]:
+    found = False
+    builder = None
+    events = ijson.sendable_list()
+    parser = ijson.parse_coro(events, use_float=True)
     
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-        'Accept': 'application/json',
-        'Referer': f'https://www.wildberries.ru/catalog/{nm_id}/detail.aspx'
-    }
+    def handle_events():
+        nonlocal found, builder
+        
+        for prefix, event, value in events:
+            if builder is not None:
+                builder.event(event, value)
+                
+                if prefix == "feedbacks.item" and event == "end_map":
+                    review_filter.add(builder.value)
+                    builder = None
+                    
+            elif prefix == "feedbacks.item" and event == "start_map":
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+                
+            elif prefix == "feedbacks" and event == "start_array":
+                found = True
+                
+        del events[:]
     
-    for url in feedback_servers:
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    url,
-                    headers=headers,
-                    timeout=10
-                )
+    async with aclosing(response.aiter_bytes(config.FEEDBACK_STREAM_CHUNK_SIZE)) as chunks:
+        async for chunk in chunks:
+            parser.send(chunk)
+            handle_events()
             
+    parser.close()
+    handle_events()
+    
+    if not found:
+        return None
+    
+    reviews = review_filter.finish()
+    PARSE_REVIEWS.labels(kind="raw").observe(len(reviews) + sum(review_filter.rejects.values()))
+    
+    return reviews
+
+
+# Ответ зеркала без фильтрации: отзывы, тело для архива и валидаторы для условных запросов
+@dataclass
+class FeedbackPayload:
+    feedbacks: List[dict]
+    body: bytes = b""
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    not_modified: bool = False
+
+
+# Запрашивает отзывы с одного зеркала (None - в ответе нет поля feedbacks).
+# С make_filter ответ читается потоково и возвращаются только прошедшие фильтр отзывы,
+# иначе - FeedbackPayload; validators делают запрос условным
+async def _request_feedbacks(
+    url: str,
+    nm_id: int,
+    imtId: int,
+    headers: dict,
+    make_filter: Optional[Callable[[], ReviewFilter]] = None,
+    validators: Optional[dict] = None
+) -> Optional[Union[List[BadReviewSchem], FeedbackPayload]]:
+    try:
+        if make_filter is not None:
+            async with upstream_stream(url, headers=headers) as response:
                 response.raise_for_status()
-                data = response.json()
                 
-                raw_reviews = data.get("feedbacks")
+                # У каждого зеркала в гонке свой фильтр
+                reviews = await _stream_feedbacks(response, make_filter())
+                FEEDBACK_PAYLOAD_BYTES.observe(response.num_bytes_downloaded)
                 
-                if raw_reviews is None:
-                    continue
-                    
-                return raw_reviews or []
-          
-          
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 404:
-                config.logger.info(f"No reviews found for imt_id {imt_id}")
-                return []
+                return reviews
+        
+        response = await upstream_get(url, headers={**headers, **(validators or {})})
+        
+        # Архивная копия не изменилась
+        if response.status_code == 304:
+            return FeedbackPayload(feedbacks=[], not_modified=True)
+    
+        response.raise_for_status()
+        FEEDBACK_PAYLOAD_BYTES.observe(response.num_bytes_downloaded)
+        data = response.json()
+        
+        raw_reviews = data.get("feedbacks")
+        
+        if raw_reviews is None:
+            return None
             
-            config.logger.error(f"HTTP error {e.response.status_code} for imt_id {nm_id}: {e}")
-            raise HTTPException(
-                status_code=status.HTTP_502_BAD_GATEWAY,
-                detail="Wildberries API returned error"
-            )
+        return FeedbackPayload(
+            feedbacks=raw_reviews or [],
+            body=response.content,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified")
+        )
+      
+      
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+            config.logger.info("No reviews found for imt_id %s", imtId)
+            return [] if make_filter is not None else FeedbackPayload(feedbacks=[])
+        
+        config.logger.error("HTTP error %s for imt_id %s: %s", e.response.status_code, nm_id, e)
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail="Wildberries API returned error"
+        )
+        
+    except httpx.TimeoutException:
+        config.logger.warning("Timeout while fetching reviews for nm_id %s", nm_id)
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="Request to Wildberries timed out"
+        )
+        
+    except httpx.RequestError as e:
+        config.logger.error("Network error fetching reviews for nm_id %s: %s", nm_id, e)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Network error connecting to Wildberries"
+        )
+        
+    except CircuitOpenError as e:
+        config.logger.warning("Skipping reviews request for nm_id %s: %s", nm_id, e)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Wildberries is temporarily unavailable"
+        )
+        
+    except (ValueError, ijson.JSONError) as e:
+        config.logger.error("JSON parsing error getting reviews for nm_id %s: %s", nm_id, e)
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail="Invalid JSON response from Wildberries"
+        )
+    
+    except HTTPException as e:
+        raise e
+        
+    except Exception as e:
+        config.logger.error("Unexpected error getting reviews for nm_id %s: %s", nm_id, e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unexpected server error"
+        )
+
+
+# Запрашивает отзывы с зеркала и обновляет его статистику
+async def _fetch_feedbacks(mirror: str, imtId: int, request: Callable[[str], Awaitable[Optional[list]]]) -> Optional[list]:
+    stats = get_mirror_stats(mirror)
+    started = time.perf_counter()
+    
+    try:
+        feedbacks = await request(mirror.format(imtId=imtId))
+        
+    except HTTPException:
+        stats.record_error()
+        raise
+    
+    # Проигравшее в гонке зеркало получает оценку задержки снизу
+    except asyncio.CancelledError:
+        stats.record_lower_bound(time.perf_counter() - started)
+        raise
+        
+    stats.record_success(time.perf_counter() - started)
+    
+    return feedbacks
+
+
+# Хеджированный запрос: следующее зеркало стартует, если предыдущие не ответили за FEEDBACK_HEDGE_DELAY
+async def _hedged_fetch_feedbacks(mirrors: List[str], imtId: int, request: Callable[[str], Awaitable[Optional[list]]]) -> list:
+    queue = list(mirrors)
+    pending = set()
+    errors = []
+    
+    try:
+        while queue or pending:
+            if queue:
+                mirror = queue.pop(0)
+                pending.add(asyncio.create_task(_fetch_feedbacks(mirror, imtId, request)))
             
-        except httpx.TimeoutException:
-            config.logger.warning(f"Timeout while fetching reviews for nm_id {nm_id}")
-            raise HTTPException(
-                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
-                detail="Request to Wildberries timed out"
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=config.FEEDBACK_HEDGE_DELAY if queue else None,
+                return_when=asyncio.FIRST_COMPLETED
             )
             
-        except httpx.RequestError as e:
-            config.logger.error(f"Network error fetching reviews for nm_id {nm_id}: {e}")
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Network error connecting to Wildberries"
-            )
+            for task in done:
+                if task.exception() is not None:
+                    errors.append(task.exception())
+                    continue
+                
+                if task.result() is not None:
+                    return task.result()
+                
+    finally:
+        for task in pending:
+            task.cancel()
             
-        except ValueError as e:
-            config.logger.error(f"JSON parsing error getting reviews for nm_id {nm_id}: {e}")
-            raise HTTPException(
-                status_code=status.HTTP_502_BAD_GATEWAY,
-                detail="Invalid JSON response from Wildberries"
-            )
+        await asyncio.gather(*pending, return_exceptions=True)
+    
+    if errors:
+        raise errors[0]
         
-        except HTTPException as e:
-            raise e
-            
-        except Exception as e:
-            config.logger.error(f"Unexpected error getting reviews for nm_id {nm_id}: {e}")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Unexpected server error"
-            )
+    return []
+
+
+# Обходит зеркала отзывов (хеджированно или по очереди)
+async def _fetch_from_mirrors(imtId: int, request: Callable[[str], Awaitable[Optional[list]]]) -> list:
+    mirrors = ordered_mirrors()
+    
+    if config.FEEDBACK_HEDGE:
+        return await _hedged_fetch_feedbacks(mirrors, imtId, request)
+    
+    for mirror in mirrors:
+        feedbacks = await _fetch_feedbacks(mirror, imtId, request)
         
+        if feedbacks is not None:
+            return feedbacks
+            
+    return []
 
-# Обрабатывает и фильтрует отзывы
-def pasrse_reviews(raw_reviews: List[dict], rating_stars: int = 3, days_passed: int = 3) -> List[BadReviewSchem]:
-    reviews = []
+
+def _feedback_headers(nm_id: int) -> dict:
+    return {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+        'Accept': 'application/json',
+        'Referer': f'https://www.wildberries.ru/catalog/{nm_id}/detail.aspx'
+    }
+
+
+# Получает необработанные отзывы по imtId (условно, если переданы валидаторы архивной копии)
+async def get_raw_reviews_from_imtid(nm_id: int, imtId: int, validators: Optional[dict] = None) -> FeedbackPayload:
+    request = functools.partial(
+        _request_feedbacks,
+        nm_id=nm_id,
+        imtId=imtId,
+        headers=_feedback_headers(nm_id),
+        validators=validators
+    )
+    
+    payload = await _fetch_from_mirrors(imtId, request)
     
-    for data in raw_reviews:
-        rating = data.get("productValuation")
+    return payload if isinstance(payload, FeedbackPayload) else FeedbackPayload(feedbacks=[])
+
+
+# Архивная копия ответа; ошибки БД не мешают парсингу
+async def _get_archive(imtId: int) -> Optional[FeedbackArchive]:
+    try:
+        return await sql_get_archive(imtId=imtId)
+    
+    except HTTPException:
+        return None
+
+
+async def _put_archive(imtId: int, payload: FeedbackPayload):
+    if not payload.body:
+        return
+    
+    try:
+        await sql_put_archive(
+            imtId=imtId,
+            payload=FeedbackArchive.pack(payload.body, config.ARCHIVE_COMPRESS_LEVEL),
+            etag=payload.etag,
+            last_modified=payload.last_modified
+        )
+    
+    except HTTPException:
+        pass
+
+
+async def _touch_archive(imtId: int):
+    try:
+        await sql_touch_archive(imtId=imtId)
         
-        if not rating or not isinstance(rating, int) or rating >= rating_stars:
-            continue
+    except HTTPException:
+        pass
+
+
+# Необработанные отзывы карточки: свежая архивная копия, условный запрос (304 - копия из архива) или полная загрузка
+async def load_raw_reviews(nm_id: int, imtId: int) -> List[dict]:
+    if not config.ARCHIVE_ENABLED:
+        return (await get_raw_reviews_from_imtid(nm_id=nm_id, imtId=imtId)).feedbacks
+    
+    archived = await _get_archive(imtId)
+    
+    if archived is not None:
+        age = (datetime.now(timezone.utc) - archived.fetched_at).total_seconds()
         
-        user_data = data.get("wbUserDetails", {})
-        createdDate = datetime.strptime(data["createdDate"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
-        updatedDate = datetime.strptime(data["updatedDate"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+        if age < config.ARCHIVE_FRESH_SECONDS:
+            return archived.feedbacks()
+    
+    validators = archived.validators() if archived is not None else None
+    payload = await get_raw_reviews_from_imtid(nm_id=nm_id, imtId=imtId, validators=validators)
+    
+    if payload.not_modified:
+        await _touch_archive(imtId)
+        return archived.feedbacks()
+    
+    await _put_archive(imtId, payload)
+    
+    return payload.feedbacks
+
+
+# Получает отзывы по imtId потоково: в памяти остаются только прошедшие фильтр
+async def get_reviews_stream_from_imtid(
+    nm_id: int,
+    imtId: int,
+    rating_stars: int = 3,
+    days_passed: int = 3
+) -> List[BadReviewSchem]:
+    request = functools.partial(
+        _request_feedbacks,
+        nm_id=nm_id,
+        imtId=imtId,
+        headers=_feedback_headers(nm_id),
+        make_filter=functools.partial(ReviewFilter, rating_stars=rating_stars, days_passed=days_passed)
+    )
+    
+    return await _fetch_from_mirrors(imtId, request)
         
-        if datetime.now(timezone.utc)- updatedDate > timedelta(days=days_passed):
-            continue
-            
-        try:
-            review = BadReviewSchem(
-                rating=rating,
-                country=user_data["country"].upper() if user_data.get("country") else None,
-                name=user_data.get("name"),
-                text=data.get("text"),
-                pros=data.get("pros"),
-                cons=data.get("cons"),
-                createdDate=createdDate,
-                updatedDate=updatedDate
+
+# Обрабатывает и фильтрует отзывы
+def pasrse_reviews(raw_reviews: List[dict], rating_stars: int = 3, days_passed: int = 3) -> List[BadReviewSchem]:
+    return ReviewFilter(rating_stars=rating_stars, days_passed=days_passed).run(raw_reviews)
+
+
+# Одновременные запросы одной карточки делят одну загрузку
+_feedback_flights = SingleFlight()
+
+
+# Скачивает и фильтрует отзывы карточки (потоково, если включён FEEDBACK_STREAMING).
+# Загрузка общая для одновременных запросов с тем же imtId, фильтр у каждого свой.
+# При потоковом разборе фильтрация входит во время скачивания, поэтому общая загрузка - только при тех же порогах
+async def fetch_reviews(nm_id: int, imtId: int, rating_stars: int = 3, days_passed: int = 3) -> List[BadReviewSchem]:
+    if config.FEEDBACK_STREAMING:
+        with timed_stage("download"):
+            reviews = await _feedback_flights.do(
+                ("stream", imtId, rating_stars, days_passed),
+                functools.partial(
+                    get_reviews_stream_from_imtid,
+                    nm_id=nm_id,
+                    imtId=imtId,
+                    rating_stars=rating_stars,
+                    days_passed=days_passed
+                )
+            )
+    
+    else:
+        with timed_stage("download"):
+            raw_reviews = await _feedback_flights.do(
+                ("raw", imtId),
+                functools.partial(load_raw_reviews, nm_id=nm_id, imtId=imtId)
             )
         
-        except:
-            continue
+        PARSE_REVIEWS.labels(kind="raw").observe(len(raw_reviews))
         
-        else:
-            reviews.append(review)
-            
+        with timed_stage("filter"):
+            reviews = pasrse_reviews(raw_reviews=raw_reviews, rating_stars=rating_stars, days_passed=days_passed)
+    
+    PARSE_REVIEWS.labels(kind="kept").observe(len(reviews))
+    
     return reviews
     
 
 # Запускает парсер
 async def parser_run(article: int, rating_stars: int = 3, days_passed: int = 3) -> Tuple[int, List[BadReviewSchem]]:
-    imtId = await get_imtid_from_nmid(article)
-    raw_reviews = await get_raw_reviews_from_imtid(nm_id=article, imtId=imtId)
+    bind_article(article)
+    
+    with timed_stage("imtid_lookup"):
+        imtId = await imtid_resolver.resolve(article)
+    
+    reviews = await fetch_reviews(nm_id=article, imtId=imtId, rating_stars=rating_stars, days_passed=days_passed)
+    
+    return imtId, reviews
+
+
+# Одинаковые одновременные запросы парсинга делят и загрузку, и запись
+_write_flights = SingleFlight()
+
+
+# В режиме all сохраняются все отзывы, а пороги запроса запоминаются как пороги чтения по умолчанию
+async def _parse_and_write(article: int, rating_stars: int, days_passed: int) -> Tuple[int, Dict[str, Any]]:
+    stores_all = config.INGEST_MODE == "all"
+    
+    imtId, reviews = await parser_run(
+        article=article,
+        rating_stars=INGEST_ALL_RATING_STARS if stores_all else rating_stars,
+        days_passed=INGEST_ALL_DAYS if stores_all else days_passed
+    )
+    
+    written = await sql_write_reviews(
+        article=article,
+        imtId=imtId,
+        rating_stars=rating_stars,
+        days_passed=days_passed,
+        reviews=reviews,
+        stores_all=stores_all
+    )
+    
+    # Сохранены все отзывы карточки, а в ответ идут только подходящие под пороги запроса
+    if stores_all:
+        written["reviews"] = apply_thresholds(written["reviews"], rating_stars, days_passed)
+    
+    return imtId, written
+
+
+# Парсит и записывает отзывы товара
+async def parse_and_write(article: int, rating_stars: int = 3, days_passed: int = 3) -> Tuple[int, Dict[str, Any]]:
+    return await _write_flights.do(
+        (article, rating_stars, days_passed),
+        functools.partial(_parse_and_write, article=article, rating_stars=rating_stars, days_passed=days_passed)
+    )
+
+
+# Запускает парсер для списка артикулов: общий imtId скачивается и фильтруется один раз
+async def parser_run_batch(
+    items: List[RequestReviewSchem]
+) -> Dict[int, Union[Tuple[int, List[BadReviewSchem]], HTTPException]]:
+    semaphore = asyncio.Semaphore(config.PARSE_BATCH_CONCURRENCY)
+    stores_all = config.INGEST_MODE == "all"
+    results: Dict[int, Union[Tuple[int, List[BadReviewSchem]], HTTPException]] = {}
+    groups: Dict[int, List[RequestReviewSchem]] = {}
+    
+    async def resolve(item: RequestReviewSchem):
+        bind_article(item.article)
+        
+        async with semaphore:
+            try:
+                with timed_stage("imtid_lookup"):
+                    imtId = await imtid_resolver.resolve(item.article)
+                
+            except HTTPException as e:
+                results[item.article] = e
+                
+            else:
+                groups.setdefault(imtId, []).append(item)
+    
+    async def fetch(imtId: int, group: List[RequestReviewSchem]):
+        # Фильтруем по самым мягким порогам группы, затем сужаем для каждого артикула
+        async with semaphore:
+            try:
+                candidates = await fetch_reviews(
+                    nm_id=group[0].article,
+                    imtId=imtId,
+                    rating_stars=INGEST_ALL_RATING_STARS if stores_all else max(item.rating_stars for item in group),
+                    days_passed=INGEST_ALL_DAYS if stores_all else max(item.days_passed for item in group)
+                )
+                
+            except HTTPException as e:
+                for item in group:
+                    results[item.article] = e
+                    
+                return
+        
+        for item in group:
+            if stores_all:
+                results[item.article] = (imtId, candidates)
+                continue
+            
+            results[item.article] = (imtId, apply_thresholds(candidates, item.rating_stars, item.days_passed))
+    
+    # Известные сопоставления подтягиваем из БД одним запросом
+    await imtid_resolver.prewarm(item.article for item in items)
+    await asyncio.gather(*(resolve(item) for item in items))
+    
+    config.logger.info("Batch resolved %s articles into %s cards", len(items), len(groups))
     
-    reviews = pasrse_reviews(raw_reviews=raw_reviews, rating_stars=rating_stars, days_passed=days_passed)
+    await asyncio.gather(*(fetch(imtId, group) for imtId, group in groups.items()))
     
-    return imtId, reviews
\ No newline at end of file
+    return results
\ No newline at end of file
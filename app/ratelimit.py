@@ -0,0 +1,233 @@
+# Внешние зависимости
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+# Внутренние модули
+from app.config import get_config
+from app.coordination import SharedRateBudget
+
+
+config = get_config()
+
+
+# Хост временно отключён автоматом после серии ошибок
+class CircuitOpenError(Exception):
+    def __init__(self, host: str, retry_in: float):
+        super().__init__(f"Circuit for {host} is open, retry in {retry_in:.1f}s")
+        self.host = host
+        self.retry_in = retry_in
+
+
+# Значение Retry-After в секундах (число или HTTP-дата)
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    
+    try:
+        return max(float(value), 0.0)
+    
+    except ValueError:
+        pass
+    
+    try:
+        moment = parsedate_to_datetime(value)
+        
+    except (TypeError, ValueError):
+        return None
+    
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+        
+    return max((moment - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+# Token bucket с адаптивной скоростью (AIMD): 429 снижает скорость, успехи плавно её поднимают
+class AdaptiveTokenBucket:
+    def __init__(self, rate: float, burst: float, min_rate: float, max_rate: float):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+        
+        
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        
+        
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                
+                self._refill(now)
+                
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                
+                
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + config.UPSTREAM_RATE_INCREASE)
+        
+        
+    def on_throttled(self, retry_after: Optional[float]):
+        self.rate = max(self.min_rate, self.rate * config.UPSTREAM_RATE_DECREASE)
+        self._tokens = 0.0
+        
+        if retry_after:
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+
+# Автомат: closed -> open после серии ошибок -> half-open (одна пробная попытка) после паузы
+class CircuitBreaker:
+    def __init__(self, host: str, failure_threshold: int, reset_timeout: float):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        
+        
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half-open"
+        
+        return "open"
+        
+        
+    # Возвращает True, если этот запрос - пробный в состоянии half-open
+    def before_request(self) -> bool:
+        state = self.state
+        
+        if state == "open" or (state == "half-open" and self._probing):
+            retry_in = max(self.reset_timeout - (time.monotonic() - (self._opened_at or 0.0)), 0.0)
+            raise CircuitOpenError(self.host, retry_in)
+        
+        if state == "half-open":
+            self._probing = True
+            return True
+            
+        return False
+            
+            
+    # Пробный запрос завершился без вердикта (429, отмена, неожиданная ошибка): следующий запрос снова может стать пробным
+    def release_probe(self):
+        self._probing = False
+        
+        
+    def record_success(self):
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        
+        
+    def record_failure(self):
+        self._failures += 1
+        
+        if self._probing or self._failures >= self.failure_threshold:
+            if self._opened_at is None:
+                config.logger.warning("Circuit for %s opened after %s failures", self.host, self._failures)
+                
+            self._opened_at = time.monotonic()
+            self._probing = False
+
+
+# Ограничения для одного хоста Wildberries
+class HostGuard:
+    def __init__(self, host: str):
+        self.host = host
+        self.bucket = AdaptiveTokenBucket(
+            rate=config.UPSTREAM_RATE,
+            burst=config.UPSTREAM_BURST,
+            min_rate=config.UPSTREAM_RATE_MIN,
+            max_rate=config.UPSTREAM_RATE_MAX
+        )
+        self.breaker = CircuitBreaker(
+            host=host,
+            failure_threshold=config.CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=config.CIRCUIT_RESET_TIMEOUT
+        )
+        # Общий бюджет хоста для всех воркеров и узлов; локальный bucket по-прежнему реагирует на 429
+        self.shared: Optional[SharedRateBudget] = SharedRateBudget(
+            key=f"upstream:{host}",
+            rate=config.UPSTREAM_SHARED_RATE,
+            burst=config.UPSTREAM_SHARED_BURST
+        ) if config.UPSTREAM_SHARED_RATE > 0 else None
+        
+        
+    # Возвращает True для пробного запроса half-open; при отмене ожидания проба освобождается
+    async def acquire(self) -> bool:
+        probe = self.breaker.before_request()
+        
+        try:
+            await self.bucket.acquire()
+            
+            if self.shared is not None:
+                await self.shared.acquire()
+                
+        except BaseException:
+            if probe:
+                self.breaker.release_probe()
+            raise
+            
+        return probe
+        
+        
+    def record_success(self):
+        self.breaker.record_success()
+        self.bucket.on_success()
+        
+        
+    # 429 - троттлинг (скорость снижается), 5xx и сетевые ошибки - отказ хоста
+    def record_throttled(self, retry_after: Optional[float], probe: bool = False):
+        self.bucket.on_throttled(retry_after)
+        
+        if probe:
+            self.breaker.release_probe()
+            
+            
+    def release_probe(self):
+        self.breaker.release_probe()
+        
+        
+    def record_failure(self):
+        self.breaker.record_failure()
+        
+        
+# Экспоненциальная задержка с полным джиттером; Retry-After имеет приоритет
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    if retry_after is not None:
+        return min(retry_after, config.UPSTREAM_BACKOFF_MAX)
+    
+    return random.uniform(0, min(config.UPSTREAM_BACKOFF_MAX, config.UPSTREAM_BACKOFF_BASE * 2 ** attempt))
+
+
+_guards: Dict[str, HostGuard] = {}
+
+
+def get_host_guard(host: str) -> HostGuard:
+    guard = _guards.get(host)
+    if guard is None:
+        guard = HostGuard(host)
+        _guards[host] = guard
+        
+    return guard
@@ -0,0 +1,133 @@
+# Внешние зависимости
+import asyncio
+import time
+from collections import OrderedDict
+from fastapi import HTTPException
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Set, Tuple
+# Внутренние модули
+from app.config import get_config
+from app.crud import sql_get_imtids
+
+
+config = get_config()
+
+
+# Двухуровневый резолвер article -> imtId: LRU в памяти с TTL поверх таблицы products
+class ImtIdResolver:
+    def __init__(self, fetch: Callable[[int], Awaitable[int]]):
+        self._fetch = fetch
+        self._cache: "OrderedDict[int, Tuple[int, float]]" = OrderedDict()
+        self._refreshing: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        
+        
+    def _get(self, article: int) -> Optional[Tuple[int, float]]:
+        entry = self._cache.get(article)
+        if entry is not None:
+            self._cache.move_to_end(article)
+            
+        return entry
+        
+        
+    def _put(self, article: int, imtId: int):
+        self._cache[article] = (imtId, time.monotonic())
+        self._cache.move_to_end(article)
+        
+        while len(self._cache) > config.IMTID_CACHE_SIZE:
+            self._cache.popitem(last=False)
+            
+            
+    # Фоновая перепроверка устаревшей записи через card API
+    async def _revalidate(self, article: int):
+        try:
+            imtId = await self._fetch(article)
+            
+        except HTTPException as e:
+            config.logger.warning("Background imtId revalidation failed for article %s: %s", article, e.detail)
+            
+        else:
+            self._put(article, imtId)
+            
+        finally:
+            self._refreshing.discard(article)
+            
+            
+    def _schedule_revalidate(self, article: int):
+        if article in self._refreshing:
+            return
+        
+        self._refreshing.add(article)
+        task = asyncio.create_task(self._revalidate(article))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        
+        
+    # Загружаем известные сопоставления из БД одним запросом
+    async def _load_from_db(self, articles: Iterable[int]) -> Dict[int, int]:
+        try:
+            known = await sql_get_imtids(articles=list(articles))
+            
+        except HTTPException:
+            return {}
+        
+        for article, imtId in known.items():
+            self._put(article, imtId)
+            
+        return known
+        
+        
+    async def resolve(self, article: int) -> int:
+        entry = self._get(article)
+        
+        if entry is not None:
+            imtId, cached_at = entry
+            
+            # Устаревшую запись отдаём сразу, а обновляем в фоне
+            if time.monotonic() - cached_at > config.IMTID_CACHE_TTL:
+                self._schedule_revalidate(article)
+                
+            return imtId
+        
+        known = await self._load_from_db([article])
+        if article in known:
+            return known[article]
+        
+        imtId = await self._fetch(article)
+        self._put(article, imtId)
+        
+        return imtId
+    
+    
+    # Прогрев кэша для списка артикулов; при fetch_missing неизвестные запрашиваются в card API
+    async def prewarm(self, articles: Iterable[int], fetch_missing: bool = False) -> Dict[int, int]:
+        articles = set(articles)
+        resolved = {article: self._cache[article][0] for article in articles if article in self._cache}
+        
+        missing = articles - resolved.keys()
+        if missing:
+            resolved.update(await self._load_from_db(missing))
+            missing -= resolved.keys()
+            
+        if fetch_missing and missing:
+            semaphore = asyncio.Semaphore(config.PARSE_BATCH_CONCURRENCY)
+            
+            async def fetch(article: int):
+                async with semaphore:
+                    try:
+                        resolved[article] = await self.resolve(article)
+                        
+                    except HTTPException as e:
+                        config.logger.info("Could not prewarm imtId for article %s: %s", article, e.detail)
+            
+            await asyncio.gather(*(fetch(article) for article in missing))
+            
+        return resolved
+    
+    
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+            
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._refreshing.clear()
@@ -0,0 +1,110 @@
+# Внешние зависимости
+from collections import Counter
+from datetime import datetime, timezone, timedelta
+from pydantic import TypeAdapter, ValidationError
+from typing import List, Optional
+# Внутренние модули
+from app.config import get_config
+from app.schemas import BadReviewSchem
+
+
+config = get_config()
+
+# Формат дат Wildberries: такие строки можно сравнивать лексикографически
+WB_DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+WB_DATE_LENGTH = 20
+
+_reviews_adapter = TypeAdapter(List[BadReviewSchem])
+
+
+# Фильтр отзывов: отсев по рейтингу и дате до построения объектов, валидация выживших пачкой
+class ReviewFilter:
+    def __init__(self, rating_stars: int = 3, days_passed: int = 3, now: Optional[datetime] = None):
+        now = now or datetime.now(timezone.utc)
+        
+        self.rating_stars = rating_stars
+        self.cutoff = now - timedelta(days=days_passed)
+        self.rejects: Counter = Counter()
+        self._cutoff_str = self.cutoff.strftime(WB_DATE_FORMAT)
+        self._candidates: List[dict] = []
+        
+        
+    # Дата не старше порога; строки в формате WB сравниваются без разбора
+    def _is_recent(self, value) -> Optional[bool]:
+        if isinstance(value, str) and len(value) == WB_DATE_LENGTH and value[-1] == "Z":
+            return value >= self._cutoff_str
+        
+        try:
+            updated = datetime.fromisoformat(value)
+            
+        except (TypeError, ValueError):
+            return None
+        
+        if updated.tzinfo is None:
+            updated = updated.replace(tzinfo=timezone.utc)
+            
+        return updated >= self.cutoff
+        
+        
+    # Принимает один сырой отзыв; True, если он стал кандидатом
+    def add(self, data: dict) -> bool:
+        rating = data.get("productValuation")
+        
+        if not rating or not isinstance(rating, int) or rating >= self.rating_stars:
+            self.rejects["rating"] += 1
+            return False
+        
+        recent = self._is_recent(data.get("updatedDate"))
+        
+        if recent is None:
+            self.rejects["bad_date"] += 1
+            return False
+        
+        if not recent:
+            self.rejects["too_old"] += 1
+            return False
+        
+        user_data = data.get("wbUserDetails") or {}
+        country = user_data.get("country")
+        
+        # Даты разбирает pydantic-core при пакетной валидации
+        self._candidates.append({
+            "wb_id": data.get("id"),
+            "rating": rating,
+            "country": country.upper() if country else None,
+            "name": user_data.get("name"),
+            "text": data.get("text"),
+            "pros": data.get("pros"),
+            "cons": data.get("cons"),
+            "createdDate": data.get("createdDate"),
+            "updatedDate": data.get("updatedDate")
+        })
+        
+        return True
+    
+    
+    # Валидирует накопленных кандидатов одним вызовом, невалидные отбрасываются с учётом причины
+    def finish(self) -> List[BadReviewSchem]:
+        candidates, self._candidates = self._candidates, []
+        
+        try:
+            reviews = _reviews_adapter.validate_python(candidates)
+            
+        except ValidationError as e:
+            invalid = {error["loc"][0] for error in e.errors() if error["loc"]}
+            self.rejects["invalid"] += len(invalid)
+            reviews = _reviews_adapter.validate_python(
+                [candidate for index, candidate in enumerate(candidates) if index not in invalid]
+            )
+        
+        if self.rejects:
+            config.logger.debug("Review filter kept %s, rejected %s", len(reviews), dict(self.rejects))
+            
+        return reviews
+    
+    
+    def run(self, raw_reviews: List[dict]) -> List[BadReviewSchem]:
+        for data in raw_reviews:
+            self.add(data)
+            
+        return self.finish()
@@ -1,42 +1,247 @@
 # Внешние зависимости
-from fastapi import APIRouter
-from fastapi.responses import JSONResponse
-from pydantic import conint
-from typing import List
+from fastapi import APIRouter, HTTPException, Header, Depends, Query, status
+from fastapi.responses import JSONResponse, ORJSONResponse, Response, StreamingResponse
+from pydantic import conint, constr
+from datetime import date, datetime
+from typing import List, Literal, Optional
 # Внутренние модули
-from app.schemas import RequestReviewSchem, BadReviewResponse
+from app.config import get_config
+from app.schemas import (
+    RequestReviewSchem, ParseResultResponse, BatchParseResultResponse, PrewarmResponse, ParseJobResponse,
+    ReviewFilterSchem, ReviewThresholdSchem, ReviewsPageResponse, ExportRequestSchem, ReviewSearchResponse,
+    ReviewStatsResponse, CatalogueStatsResponse
+)
 from app.models import BadReview
-from app.parser import parser_run
-from app.crud import sql_get_reviews, sql_write_reviews
+from app.parser import apply_thresholds, parse_and_write, parser_run_batch, imtid_resolver
+from app.crud import (
+    sql_get_reviews, sql_get_reviews_page, sql_get_product, stream_reviews, stream_export,
+    sql_write_reviews_batch, sql_create_job, sql_get_job, sql_search_reviews,
+    sql_get_review_stats, sql_get_catalogue_stats
+)
+from app.jobs import job_pool
+from app.cache import reviews_cache, etag_matches
+from app.serialization import dumps, reviews_to_dicts
+from app.export import EXPORT_FORMATS, encode_export, parquet_available
 
 
+config = get_config()
 router = APIRouter()
 
 
-# Выводим отзывывы по article из БД
+# Выводим отзывывы по article из БД (через кэш сериализованных ответов, с поддержкой ETag)
 @router.get("/api/v1/reviews/{article}", response_class=JSONResponse)
-async def get_reviews(article: conint(ge=0)):
-    result = await sql_get_reviews(article=article)
+async def get_reviews(
+    article: conint(ge=0),
+    thresholds: ReviewThresholdSchem = Depends(),
+    if_none_match: Optional[str] = Header(default=None)
+):
+    variant = (thresholds.rating_stars, thresholds.days_passed)
+    cached = reviews_cache.get(article, variant)
     
-    return result
+    if cached is None:
+        generation = reviews_cache.generation(article)
+        result = await sql_get_reviews(article=article, **thresholds.model_dump())
+        body = dumps(result)
+        cached = reviews_cache.put(article, body, generation, variant)
+        
+    if etag_matches(if_none_match, cached.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": cached.etag})
+        
+    return Response(content=cached.body, media_type="application/json", headers={"ETag": cached.etag})
+
+
+
+# Страница отзывов с фильтрами и keyset-курсором
+@router.get("/api/v1/reviews/{article}/page", response_model=ReviewsPageResponse)
+async def get_reviews_page(
+    article: conint(ge=0),
+    filters: ReviewFilterSchem = Depends(),
+    limit: int = Query(default=100, ge=1, le=config.REVIEWS_PAGE_MAX),
+    cursor: Optional[str] = None
+):
+    return await sql_get_reviews_page(article=article, filters=filters, limit=limit, cursor=cursor)
+
+
+# Все отзывы товара с фильтрами в формате NDJSON, строки пишутся по мере чтения из БД
+@router.get("/api/v1/reviews/{article}/ndjson")
+async def get_reviews_ndjson(article: conint(ge=0), filters: ReviewFilterSchem = Depends()):
+    product = await sql_get_product(article=article)
+    
+    async def lines():
+        async for review in stream_reviews(product=product, filters=filters):
+            yield dumps(review) + b"\n"
+            
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+# Статистика отзывов товара: по рейтингу, дням и странам (предрасчитана при записи)
+@router.get("/api/v1/reviews/{article}/stats", response_model=ReviewStatsResponse)
+async def get_review_stats(article: conint(ge=0), day_from: Optional[date] = None, day_to: Optional[date] = None):
+    return ORJSONResponse(content=await sql_get_review_stats(article=article, day_from=day_from, day_to=day_to))
+
+
+# Статистика отзывов по всем товарам
+@router.get("/api/v1/stats", response_model=CatalogueStatsResponse)
+async def get_catalogue_stats(day_from: Optional[date] = None, day_to: Optional[date] = None):
+    return ORJSONResponse(content=await sql_get_catalogue_stats(day_from=day_from, day_to=day_to))
+
+
+# Полнотекстовый поиск по сохранённым отзывам (text, pros, cons) с фильтрами по товарам и рейтингу
+@router.get("/api/v1/search/reviews", response_model=ReviewSearchResponse)
+async def search_reviews(
+    q: constr(strip_whitespace=True, min_length=1, max_length=200),
+    articles: Optional[List[conint(ge=0)]] = Query(default=None),
+    rating_min: Optional[conint(ge=0)] = None,
+    rating_max: Optional[conint(ge=0)] = None,
+    limit: int = Query(default=100, ge=1, le=config.REVIEWS_PAGE_MAX),
+    offset: int = Query(default=0, ge=0)
+):
+    reviews = await sql_search_reviews(
+        query=q,
+        articles=articles,
+        rating_min=rating_min,
+        rating_max=rating_max,
+        limit=limit,
+        offset=offset
+    )
+    
+    return ORJSONResponse(content={"query": q, "reviews": reviews})
+
+
+def _export_response(data: ExportRequestSchem) -> StreamingResponse:
+    # Проверяем до начала потока: после первых байтов статус ответа уже не поменять
+    if data.format == "parquet" and not parquet_available():
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Parquet export requires pyarrow"
+        )
+        
+    media_type, extension = EXPORT_FORMATS[data.format]
+    chunks = stream_export(articles=data.articles, since=data.since)
+    
+    return StreamingResponse(
+        encode_export(chunks, data.format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="reviews.{extension}"'}
+    )
+
+
+# Массовая выгрузка отзывов по списку артикулов или по всем товарам (NDJSON, CSV или Parquet)
+@router.get("/api/v1/export/reviews")
+async def export_reviews(
+    format: Literal["ndjson", "csv", "parquet"] = "ndjson",
+    articles: Optional[List[conint(ge=0)]] = Query(default=None),
+    since: Optional[datetime] = None
+):
+    return _export_response(ExportRequestSchem(format=format, articles=articles, since=since))
+
+
+# То же для длинных списков артикулов - в теле запроса
+@router.post("/api/v1/export/reviews")
+async def export_reviews_post(data: ExportRequestSchem):
+    return _export_response(data)
 
 
 # Папрсим и записываем отзывы в БД
-@router.post("/api/v1/parse/", response_model=List[BadReviewResponse])
+@router.post("/api/v1/parse/", response_model=ParseResultResponse)
 async def parse_reviews(data: RequestReviewSchem):
-    imtId, result = await parser_run(**data.model_dump())
-    
-    reviews = await sql_write_reviews(
-        article=data.article,
-        imtId=imtId,
-        rating_stars=data.rating_stars,
-        days_passed=data.days_passed,
-        reviews=result
-    )
+    imtId, written = await parse_and_write(**data.model_dump())
+    
+    # Строки уже провалидированы при записи: отдаём без повторной проверки через response_model
+    return ORJSONResponse(content={
+        "article": data.article,
+        "imtId": imtId,
+        **written,
+        "reviews": reviews_to_dicts(written["reviews"])
+    })
+
+
+# Пакетный парсинг и запись отзывов в БД
+@router.post("/api/v1/parse/batch/", response_model=List[BatchParseResultResponse])
+async def parse_reviews_batch(data: List[RequestReviewSchem]):
+    if len(data) > config.PARSE_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch is limited to {config.PARSE_BATCH_MAX_ITEMS} articles"
+        )
+        
+    # Повторяющиеся артикулы обрабатываем один раз (последний запрос побеждает)
+    items = list({item.article: item for item in data}.values())
+    parsed = await parser_run_batch(items)
     
-    return reviews
+    written = await sql_write_reviews_batch(
+        batch=[
+            (item, *parsed[item.article])
+            for item in items
+            if not isinstance(parsed[item.article], HTTPException)
+        ],
+        stores_all=config.INGEST_MODE == "all"
+    )
     
+    response = []
+    for item in items:
+        parsed_item = parsed[item.article]
+        imtId = None if isinstance(parsed_item, HTTPException) else parsed_item[0]
+        result = written.get(item.article, parsed_item)
         
+        if isinstance(result, HTTPException):
+            response.append({
+                "article": item.article,
+                "imtId": imtId,
+                "status_code": result.status_code,
+                "detail": result.detail,
+                "added": 0,
+                "updated": 0,
+                "removed": 0,
+                "reviews": []
+            })
+            
+        else:
+            response.append({
+                "article": item.article,
+                "imtId": imtId,
+                "status_code": status.HTTP_200_OK,
+                "detail": None,
+                **result,
+                # В режиме all записаны все отзывы, в ответ - только проходящие пороги запроса
+                "reviews": reviews_to_dicts(
+                    apply_thresholds(result["reviews"], item.rating_stars, item.days_passed)
+                    if config.INGEST_MODE == "all" else result["reviews"]
+                )
+            })
+            
+    return ORJSONResponse(content=response)
+
+
+# Прогреваем кэш imtId для списка артикулов
+@router.post("/api/v1/resolve/prewarm/", response_model=PrewarmResponse)
+async def prewarm_imtids(articles: List[conint(ge=0)]):
+    if len(articles) > config.PARSE_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch is limited to {config.PARSE_BATCH_MAX_ITEMS} articles"
+        )
         
+    resolved = await imtid_resolver.prewarm(articles, fetch_missing=True)
+    
+    return PrewarmResponse(
+        resolved=len(resolved),
+        missing=sorted(set(articles) - resolved.keys())
+    )
+
+
+# Ставим парсинг в очередь и сразу возвращаем id задачи
+@router.post("/api/v1/parse/jobs/", response_model=ParseJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def enqueue_parse_job(data: RequestReviewSchem):
+    job = await sql_create_job(data=data)
+    job_pool.notify()
+    
+    return ParseJobResponse.model_validate(job)
+
+
+# Состояние и результат задачи парсинга
+@router.get("/api/v1/parse/jobs/{job_id}", response_model=ParseJobResponse)
+async def get_parse_job(job_id: conint(ge=1)):
+    job = await sql_get_job(job_id=job_id)
     
-    
\ No newline at end of file
+    return ParseJobResponse.model_validate(job)
\ No newline at end of file
@@ -0,0 +1,146 @@
+# Внешние зависимости
+import asyncio
+import time
+from datetime import timedelta
+from fastapi import HTTPException
+from typing import Optional, Set
+# Внутренние модули
+from app.config import get_config
+from app.coordination import LeaderLock, LEADER_SCHEDULER
+from app.crud import sql_count_products, sql_get_due_products, sql_record_refresh_failure
+from app.models import Product
+from app.parser import parse_and_write
+from app.tracing import trace
+
+
+config = get_config()
+
+
+# Фоновое обновление отслеживаемых товаров: самые устаревшие первыми, нагрузка равномерно по интервалу
+class RefreshScheduler:
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._in_flight: Set[int] = set()
+        self._refreshes: Set[asyncio.Task] = set()
+        self._semaphore = asyncio.Semaphore(config.SCHEDULER_CONCURRENCY)
+        self._next_start = 0.0
+        self._leader = LeaderLock(LEADER_SCHEDULER)
+        
+        
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._lead())
+            config.logger.info("Refresh scheduler started")
+            
+            
+    async def stop(self):
+        tasks = list(self._refreshes)
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+            
+        for task in tasks:
+            task.cancel()
+            
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._leader.release()
+        
+        
+    # Пауза между запусками: весь каталог за интервал, но не быстрее бюджета RPS
+    async def _pace(self, total: int):
+        spacing = max(1 / config.SCHEDULER_RPS, config.SCHEDULER_INTERVAL / max(total, 1))
+        delay = self._next_start - time.monotonic()
+        
+        if delay > 0:
+            await asyncio.sleep(delay)
+            
+        self._next_start = max(self._next_start, time.monotonic()) + spacing
+        
+        
+    # Без отметки о неудаче товар остаётся самым устаревшим и выбирается снова в каждом проходе
+    async def _record_failure(self, product: Product):
+        try:
+            await sql_record_refresh_failure(article=product.article)
+            
+        except Exception as e:
+            config.logger.error("Failed to postpone refresh of article %s: %s", product.article, e)
+            
+            
+    async def _refresh(self, product: Product):
+        try:
+            imtId, written = await parse_and_write(
+                article=product.article,
+                rating_stars=product.rating_stars,
+                days_passed=product.days_passed
+            )
+            
+            config.logger.debug(
+                "Scheduled refresh of article %s: added %s, updated %s, removed %s",
+                product.article, written["added"], written["updated"], written["removed"]
+            )
+            
+        except HTTPException as e:
+            config.logger.warning("Scheduled refresh of article %s failed: %s %s", product.article, e.status_code, e.detail)
+            await self._record_failure(product)
+            
+        except Exception as e:
+            config.logger.error("Unexpected error refreshing article %s: %s", product.article, e)
+            await self._record_failure(product)
+            
+        finally:
+            self._in_flight.discard(product.article)
+            self._semaphore.release()
+            
+            
+    # Обновляет каталог только один процесс среди всех воркеров и узлов, остальные ждут своей очереди
+    async def _lead(self):
+        while True:
+            try:
+                leader = await self._leader.acquire()
+                
+            except Exception as e:
+                config.logger.error("Refresh scheduler failed to take the leader lock: %s", e)
+                leader = False
+                
+            if not leader:
+                await asyncio.sleep(config.SCHEDULER_IDLE_SLEEP)
+                continue
+            
+            config.logger.info("Refresh scheduler is the leader")
+            await self._loop()
+            
+            
+    async def _loop(self):
+        while await self._leader.held():
+            try:
+                total = await sql_count_products()
+                due = await sql_get_due_products(
+                    interval=config.SCHEDULER_INTERVAL,
+                    quiet_after=timedelta(days=config.SCHEDULER_QUIET_AFTER_DAYS),
+                    quiet_factor=config.SCHEDULER_QUIET_FACTOR,
+                    limit=config.SCHEDULER_BATCH
+                )
+                
+            except Exception as e:
+                config.logger.error("Refresh scheduler failed to load due products: %s", e)
+                await asyncio.sleep(config.SCHEDULER_IDLE_SLEEP)
+                continue
+            
+            due = [product for product in due if product.article not in self._in_flight]
+            
+            if not due:
+                await asyncio.sleep(config.SCHEDULER_IDLE_SLEEP)
+                continue
+            
+            for product in due:
+                await self._pace(total)
+                await self._semaphore.acquire()
+                
+                self._in_flight.add(product.article)
+                with trace(f"refresh-{product.article}"):
+                    task = asyncio.create_task(self._refresh(product))
+                self._refreshes.add(task)
+                task.add_done_callback(self._refreshes.discard)
+
+
+refresh_scheduler = RefreshScheduler()
@@ -1,7 +1,7 @@
 # Внешние зависимости
 from pydantic import BaseModel, constr, conint
 from datetime import datetime
-from typing import Optional
+from typing import Dict, Literal, Optional, List
 
 
 # Схема запроса для парсинага отзывов
@@ -9,11 +9,12 @@ class RequestReviewSchem(BaseModel):
     article: conint(ge=0)
     rating_stars: conint(ge=0, le=6) = 3
     days_passed: conint(ge=0) = 3
-    
+
 
 class BadReviewResponse(BaseModel):
     id: conint(ge=1)
     product_id: conint(ge=0)
+    wb_id: Optional[str] = None
     rating: conint(ge=0)
     country: Optional[constr(min_length=1, max_length=10)]
     name: Optional[constr(min_length=1, max_length=100)]
@@ -22,13 +23,42 @@ class BadReviewResponse(BaseModel):
     cons: str
     createdDate: datetime
     updatedDate: datetime
-
+    
     class Config:
         from_attributes = True
-        
-        
+
+
+# Результат прогрева кэша imtId
+class PrewarmResponse(BaseModel):
+    resolved: int
+    missing: List[int]
+
+
+# Результат парсинга: сколько отзывов добавлено, обновлено и удалено
+class ParseResultResponse(BaseModel):
+    article: conint(ge=0)
+    imtId: int
+    added: conint(ge=0) = 0
+    updated: conint(ge=0) = 0
+    removed: conint(ge=0) = 0
+    reviews: List[BadReviewResponse] = []
+
+
+# Результат пакетного парсинга по одному артикулу
+class BatchParseResultResponse(BaseModel):
+    article: conint(ge=0)
+    imtId: Optional[int] = None
+    status_code: int
+    detail: Optional[str] = None
+    added: conint(ge=0) = 0
+    updated: conint(ge=0) = 0
+    removed: conint(ge=0) = 0
+    reviews: List[BadReviewResponse] = []
+
+
 # Схема отзывов
 class BadReviewSchem(BaseModel):
+    wb_id: Optional[constr(max_length=64)] = None
     rating: conint(ge=0)
     country: Optional[constr(min_length=1, max_length=10)]
     name: Optional[constr(min_length=1, max_length=100)]
@@ -39,4 +69,82 @@ class BadReviewSchem(BaseModel):
     updatedDate: datetime
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+# Состояние задачи асинхронного парсинга
+class ParseJobResponse(BaseModel):
+    id: int
+    article: conint(ge=0)
+    rating_stars: int
+    days_passed: int
+    status: str
+    attempts: int = 0
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    error_code: Optional[int] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+
+# Пороги при чтении: рейтинг ниже rating_stars, обновлён не раньше days_passed дней назад
+class ReviewThresholdSchem(BaseModel):
+    rating_stars: Optional[conint(ge=0, le=6)] = None
+    days_passed: Optional[conint(ge=0, le=36500)] = None
+
+
+# Фильтры чтения отзывов (query-параметры)
+class ReviewFilterSchem(ReviewThresholdSchem):
+    rating_min: Optional[conint(ge=0)] = None
+    rating_max: Optional[conint(ge=0)] = None
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None
+    country: Optional[constr(min_length=1, max_length=10)] = None
+
+
+# Страница отзывов с курсором на следующую
+class ReviewsPageResponse(BaseModel):
+    article: conint(ge=0)
+    imtId: int
+    reviews: List[BadReviewResponse]
+    next_cursor: Optional[str] = None
+
+# Массовая выгрузка отзывов: articles не задан - все товары, since - только изменённые с этого момента
+class ExportRequestSchem(BaseModel):
+    format: Literal["ndjson", "csv", "parquet"] = "ndjson"
+    articles: Optional[List[conint(ge=0)]] = None
+    since: Optional[datetime] = None
+
+
+# Отзыв в результатах поиска: артикул товара и релевантность
+class SearchReviewResponse(BadReviewResponse):
+    article: conint(ge=0)
+    rank: float
+
+
+class ReviewSearchResponse(BaseModel):
+    query: str
+    reviews: List[SearchReviewResponse]
+
+
+# Статистика отзывов: количество по рейтингу, дням создания (YYYY-MM-DD, UTC) и странам
+class ReviewStatsBreakdown(BaseModel):
+    reviews_count: int
+    first_review_at: Optional[datetime] = None
+    last_review_at: Optional[datetime] = None
+    by_rating: Dict[str, int]
+    by_day: Dict[str, int]
+    by_country: Dict[str, int]
+
+
+class ReviewStatsResponse(ReviewStatsBreakdown):
+    article: conint(ge=0)
+    imtId: int
+
+
+class CatalogueStatsResponse(ReviewStatsBreakdown):
+    products_count: int
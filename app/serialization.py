@@ -0,0 +1,39 @@
+# Внешние зависимости
+import operator
+from typing import Any, Dict, Iterable, List, Sequence
+import orjson
+# Внутренние модули
+from app.models import BadReview
+
+
+# Поля отзыва в ответах API (порядок - как у BadReviewResponse)
+REVIEW_FIELDS = (
+    "id", "product_id", "wb_id", "rating", "country", "name",
+    "text", "pros", "cons", "createdDate", "updatedDate"
+)
+
+# Колонки для выборки кортежами вместо ORM-объектов
+REVIEW_COLUMNS = [getattr(BadReview, name) for name in REVIEW_FIELDS]
+
+# Поля строки массовой выгрузки: товар и отзыв
+EXPORT_FIELDS = ("article", "imtId") + REVIEW_FIELDS
+
+# Поля результата полнотекстового поиска: товар, отзыв и релевантность
+SEARCH_FIELDS = ("article",) + REVIEW_FIELDS + ("rank",)
+
+_review_values = operator.attrgetter(*REVIEW_FIELDS)
+
+
+# Строки выборки REVIEW_COLUMNS -> словари для ответа
+def rows_to_dicts(rows: Iterable[Sequence[Any]]) -> List[Dict[str, Any]]:
+    return [dict(zip(REVIEW_FIELDS, row)) for row in rows]
+
+
+# Уже загруженные ORM-объекты -> словари без повторной валидации через BadReviewResponse
+def reviews_to_dicts(reviews: Iterable[BadReview]) -> List[Dict[str, Any]]:
+    return [dict(zip(REVIEW_FIELDS, _review_values(review))) for review in reviews]
+
+
+# JSON сразу в байты; даты - ISO 8601, как у jsonable_encoder
+def dumps(data: Any) -> bytes:
+    return orjson.dumps(data)
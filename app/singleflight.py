@@ -0,0 +1,31 @@
+# Внешние зависимости
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+# Объединение одновременных вызовов: пока задача с ключом выполняется, новые вызовы ждут её результата
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        
+        
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+            
+        # Ошибку могли не забрать, если все ожидающие были отменены
+        if not task.cancelled():
+            task.exception()
+            
+            
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            
+        # Отмена одного из ожидающих не отменяет общую задачу
+        return await asyncio.shield(task)
+
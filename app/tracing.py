@@ -0,0 +1,65 @@
+# Внешние зависимости
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, Optional
+
+
+# Контекст запроса API или фоновой задачи: id для логов, артикул и суммарное время этапов
+@dataclass
+class TraceContext:
+    request_id: str
+    article: Optional[int] = None
+    stages: Dict[str, float] = field(default_factory=dict)
+    started: float = field(default_factory=time.perf_counter)
+    
+    # Время этапов в миллисекундах для логов
+    def stages_ms(self) -> Dict[str, float]:
+        return {stage: round(seconds * 1000, 2) for stage, seconds in self.stages.items()}
+
+
+_trace: ContextVar[Optional[TraceContext]] = ContextVar("trace", default=None)
+# Артикул задачи: в пакетном парсинге у каждой задачи свой
+_article: ContextVar[Optional[int]] = ContextVar("article", default=None)
+
+
+def current_trace() -> Optional[TraceContext]:
+    return _trace.get()
+
+
+def current_article() -> Optional[int]:
+    return _article.get()
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+@contextmanager
+def trace(request_id: Optional[str] = None) -> Iterator[TraceContext]:
+    context = TraceContext(request_id=request_id or new_request_id())
+    token = _trace.set(context)
+    
+    try:
+        yield context
+        
+    finally:
+        _trace.reset(token)
+
+
+# Артикул для логов текущей задачи; в контексте запроса остаётся первый
+def bind_article(article: int):
+    _article.set(article)
+    
+    context = _trace.get()
+    if context is not None and context.article is None:
+        context.article = article
+
+
+# Добавляем время этапа к контексту запроса (повторяющиеся этапы суммируются)
+def record_stage(stage: str, seconds: float):
+    context = _trace.get()
+    if context is not None:
+        context.stages[stage] = context.stages.get(stage, 0.0) + seconds
@@ -0,0 +1,86 @@
+# Бенчмарк фильтрации отзывов: python -m benchmarks.bench_filter [--sizes 1000 10000] [--repeat 5]
+# Внешние зависимости
+import argparse
+import statistics
+import time
+from datetime import datetime, timezone, timedelta
+from typing import List
+# Внутренние модули
+from app.review_filter import ReviewFilter
+from app.schemas import BadReviewSchem
+from benchmarks.synthetic import make_feedbacks
+
+
+# Прежняя реализация pasrse_reviews - точка отсчёта для сравнения
+def legacy_filter(raw_reviews: List[dict], rating_stars: int, days_passed: int) -> List[BadReviewSchem]:
+    reviews = []
+    
+    for data in raw_reviews:
+        rating = data.get("productValuation")
+        
+        if not rating or not isinstance(rating, int) or rating >= rating_stars:
+            continue
+        
+        user_data = data.get("wbUserDetails", {})
+        createdDate = datetime.strptime(data["createdDate"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+        updatedDate = datetime.strptime(data["updatedDate"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+        
+        if datetime.now(timezone.utc) - updatedDate > timedelta(days=days_passed):
+            continue
+            
+        try:
+            review = BadReviewSchem(
+                rating=rating,
+                country=user_data["country"].upper() if user_data.get("country") else None,
+                name=user_data.get("name"),
+                text=data.get("text"),
+                pros=data.get("pros"),
+                cons=data.get("cons"),
+                createdDate=createdDate,
+                updatedDate=updatedDate
+            )
+        
+        except Exception:
+            continue
+        
+        reviews.append(review)
+            
+    return reviews
+
+
+def measure(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+        
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark review filtering")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 50_000, 200_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--rating-stars", type=int, default=3)
+    parser.add_argument("--days-passed", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    
+    print(f"{'feedbacks':>10} {'kept':>8} {'legacy, ms':>12} {'filter, ms':>12} {'speedup':>8} {'filter, items/s':>16}")
+    
+    for size in args.sizes:
+        raw_reviews = make_feedbacks(size, seed=args.seed)
+        
+        kept = len(ReviewFilter(args.rating_stars, args.days_passed).run(raw_reviews))
+        legacy = measure(lambda: legacy_filter(raw_reviews, args.rating_stars, args.days_passed), args.repeat)
+        current = measure(lambda: ReviewFilter(args.rating_stars, args.days_passed).run(raw_reviews), args.repeat)
+        
+        print(
+            f"{size:>10} {kept:>8} {legacy * 1000:>12.1f} {current * 1000:>12.1f} "
+            f"{legacy / current:>7.1f}x {size / current:>16,.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
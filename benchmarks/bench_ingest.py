@@ -0,0 +1,118 @@
+# Бенчмарк записи отзывов: python -m benchmarks.bench_ingest [--sizes 1000 10000 50000] [--repeat 3]
+# Нужен настоящий Postgres из DATABASE_URL; создаются и удаляются товары с артикулами от --article-base
+# Внешние зависимости
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List, Optional
+import sqlalchemy as sa
+from fastapi import HTTPException
+# Внутренние модули
+from app.config import get_config
+from app.crud import sql_write_reviews
+from app.database import setup_database, AsyncSessionLocal
+from app.models import Product, BadReview
+from app.review_filter import ReviewFilter
+from app.schemas import BadReviewSchem
+from benchmarks.synthetic import make_feedbacks
+
+
+config = get_config()
+
+
+# Отзывы для записи: все оценки, без ограничения по дате
+def make_reviews(size: int, seed: int) -> List[BadReviewSchem]:
+    return ReviewFilter(rating_stars=6, days_passed=100_000).run(make_feedbacks(size, seed=seed))
+
+
+# Та же выборка, у каждого десятого отзыва изменён текст
+def mutate_reviews(reviews: List[BadReviewSchem]) -> List[BadReviewSchem]:
+    return [
+        review.model_copy(update={"text": review.text + " (изменено)"}) if index % 10 == 0 else review
+        for index, review in enumerate(reviews)
+    ]
+
+
+async def write(article: int, reviews: List[BadReviewSchem]) -> Optional[float]:
+    started = time.perf_counter()
+    
+    try:
+        await sql_write_reviews(article=article, imtId=article, rating_stars=6, days_passed=100_000, reviews=reviews)
+    
+    except HTTPException:
+        return None
+    
+    return time.perf_counter() - started
+
+
+async def cleanup(article_base: int):
+    async with AsyncSessionLocal() as session:
+        product_ids = sa.select(Product.id).where(Product.article >= article_base)
+        await session.execute(sa.delete(BadReview).where(BadReview.product_id.in_(product_ids)))
+        await session.execute(sa.delete(Product).where(Product.article >= article_base))
+        await session.commit()
+
+
+# Медиана по повторам для трёх сценариев: первая загрузка, повтор без изменений, повтор с 10% изменений
+async def measure(
+    reviews: List[BadReviewSchem],
+    changed: List[BadReviewSchem],
+    threshold: int,
+    article: int,
+    repeat: int
+) -> List[Optional[float]]:
+    config.REVIEWS_COPY_THRESHOLD = threshold
+    timings = [[], [], []]
+    
+    for attempt in range(repeat):
+        target = article + attempt
+        for index, batch in enumerate((reviews, reviews, changed)):
+            timings[index].append(await write(target, batch))
+    
+    return [
+        None if any(value is None for value in values) else statistics.median(values)
+        for values in timings
+    ]
+
+
+def fmt(value: Optional[float]) -> str:
+    return f"{value * 1000:.0f}" if value is not None else "n/a"
+
+
+async def run(args):
+    await setup_database()
+    await cleanup(args.article_base)
+    
+    print(f"{'reviews':>8} {'path':>7} {'initial, ms':>12} {'same, ms':>10} {'10% changed, ms':>16}")
+    
+    try:
+        for offset, size in enumerate(args.sizes):
+            reviews = make_reviews(size, args.seed)
+            changed = mutate_reviews(reviews)
+            article = args.article_base + offset * 1000
+            
+            # INSERT ... VALUES выше ~2970 отзывов упирается в лимит параметров и показывается как n/a
+            insert_timings = await measure(reviews, changed, len(reviews) + 1, article, args.repeat)
+            copy_timings = await measure(reviews, changed, 0, article + 500, args.repeat)
+            
+            for name, timings in (("insert", insert_timings), ("copy", copy_timings)):
+                print(f"{len(reviews):>8} {name:>7} {fmt(timings[0]):>12} {fmt(timings[1]):>10} {fmt(timings[2]):>16}")
+    
+    finally:
+        await cleanup(args.article_base)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark review ingestion: INSERT vs COPY")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 2_500, 10_000, 50_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--article-base", type=int, default=2_000_000_000)
+    args = parser.parse_args()
+    
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# Бенчмарк сериализации ответов с отзывами: python -m benchmarks.bench_serialize [--sizes 1000 10000] [--repeat 5]
+# Сравнивает прежний путь (to_dict/response_model + jsonable_encoder + json) с быстрым (кортежи + orjson).
+# Выборка из БД не измеряется: строки собираются в памяти
+# Внешние зависимости
+import argparse
+import json
+import statistics
+import time
+from typing import Callable, List
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+# Внутренние модули
+from app.models import BadReview
+from app.review_filter import ReviewFilter
+from app.schemas import ParseResultResponse
+from app.serialization import REVIEW_FIELDS, dumps, reviews_to_dicts, rows_to_dicts
+from benchmarks.synthetic import make_feedbacks
+
+
+_parse_result_adapter = TypeAdapter(ParseResultResponse)
+
+
+def make_rows(size: int, seed: int) -> List[BadReview]:
+    reviews = ReviewFilter(rating_stars=6, days_passed=100_000).run(make_feedbacks(size, seed=seed))
+    
+    return [
+        BadReview(id=index + 1, product_id=1, **review.model_dump())
+        for index, review in enumerate(reviews)
+    ]
+
+
+# GET /api/v1/reviews/{article}: было - ORM-объекты, to_dict и json.dumps(jsonable_encoder(...))
+def legacy_get(rows: List[BadReview]) -> bytes:
+    result = {"article": 1, "imtId": 1, "reviews_count": len(rows), "reviews": [row.to_dict() for row in rows]}
+    return json.dumps(jsonable_encoder(result), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+# Стало - кортежи колонок и orjson
+def fast_get(tuples: List[tuple]) -> bytes:
+    return dumps({"article": 1, "imtId": 1, "reviews_count": len(tuples), "reviews": rows_to_dicts(tuples)})
+
+
+# POST /api/v1/parse/: было - валидация через response_model и сериализация FastAPI
+def legacy_parse(rows: List[BadReview]) -> bytes:
+    model = ParseResultResponse(article=1, imtId=1, added=len(rows), reviews=rows)
+    validated = _parse_result_adapter.validate_python(model, from_attributes=True)
+    return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+
+# Стало - словари из атрибутов и orjson без повторной валидации
+def fast_parse(rows: List[BadReview]) -> bytes:
+    return dumps({"article": 1, "imtId": 1, "added": len(rows), "updated": 0, "removed": 0, "reviews": reviews_to_dicts(rows)})
+
+
+def measure(func: Callable[[], bytes], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+        
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark review response serialization")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    
+    print(f"{'reviews':>8} {'endpoint':>9} {'legacy, ms':>11} {'fast, ms':>9} {'speedup':>8}")
+    
+    for size in args.sizes:
+        rows = make_rows(size, args.seed)
+        tuples = [tuple(getattr(row, name) for name in REVIEW_FIELDS) for row in rows]
+        
+        # Быстрый путь отдаёт те же данные
+        assert json.loads(fast_get(tuples)) == json.loads(legacy_get(rows))
+        
+        for name, legacy, fast in (
+            ("get", lambda: legacy_get(rows), lambda: fast_get(tuples)),
+            ("parse", lambda: legacy_parse(rows), lambda: fast_parse(rows))
+        ):
+            legacy_time = measure(legacy, args.repeat)
+            fast_time = measure(fast, args.repeat)
+            print(f"{size:>8} {name:>9} {legacy_time * 1000:>11.1f} {fast_time * 1000:>9.1f} {legacy_time / fast_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# Локальная заглушка Wildberries: python -m benchmarks.fake_wb [--port 9000] [--feedbacks-min 500 --feedbacks-max 500]
+# Отдаёт card API и зеркала отзывов с синтетическими или записанными ответами,
+# добавляет задержку, 429, 5xx и таймауты. Приложение направляется на неё через WB_CARD_URL и WB_FEEDBACK_MIRRORS
+# Внешние зависимости
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import List, Optional, Tuple
+import uvicorn
+from fastapi import FastAPI, Header, Query, Response
+# Внутренние модули
+from benchmarks.synthetic import make_feedbacks
+
+
+# Переменные окружения приложения для заглушки на host:port (зеркала на двух именах хоста - как два хоста WB)
+def app_env(host: str, port: int) -> dict:
+    return {
+        "WB_CARD_URL": f"http://{host}:{port}/cards/v4/detail",
+        "WB_FEEDBACK_MIRRORS": ",".join([
+            f"http://{host}:{port}/feedbacks/v2/{{imtId}}",
+            f"http://localhost:{port}/feedbacks/v2/{{imtId}}",
+            f"http://{host}:{port}/feedbacks/v1/{{imtId}}"
+        ])
+    }
+
+
+class FakeWildberries:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.stats: Counter = Counter()
+        self._bodies: "OrderedDict[int, Tuple[bytes, str]]" = OrderedDict()
+        self._recorded: List[bytes] = [
+            path.read_bytes() for path in sorted(Path(args.recorded).glob("*.json"))
+        ] if args.recorded else []
+        
+        
+    # Ответ с отзывами карточки: записанный или синтетический, детерминирован по imtId
+    def body(self, imtId: int) -> Tuple[bytes, str]:
+        cached = self._bodies.get(imtId)
+        if cached is not None:
+            self._bodies.move_to_end(imtId)
+            return cached
+            
+        if self._recorded:
+            body = self._recorded[imtId % len(self._recorded)]
+        else:
+            count = random.Random(imtId).randint(self.args.feedbacks_min, self.args.feedbacks_max)
+            body = json.dumps({"feedbacks": make_feedbacks(count, seed=imtId)}, ensure_ascii=False).encode("utf-8")
+            
+        cached = (body, '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"')
+        self._bodies[imtId] = cached
+        
+        while len(self._bodies) > self.args.cache_cards:
+            self._bodies.popitem(last=False)
+            
+        return cached
+        
+        
+    # Задержка и сбои; возвращает ответ-ошибку или None, если запрос нужно обслужить
+    async def inject(self, kind: str) -> Optional[Response]:
+        delay = max(self.rng.gauss(self.args.latency_ms, self.args.jitter_ms), 0) / 1000
+        roll = self.rng.random()
+        
+        if roll < self.args.ptimeout:
+            self.stats[f"{kind}_timeout"] += 1
+            await asyncio.sleep(self.args.timeout_sleep)
+            return Response(status_code=504)
+            
+        await asyncio.sleep(delay)
+        roll -= self.args.ptimeout
+        
+        if roll < self.args.p429:
+            self.stats[f"{kind}_429"] += 1
+            return Response(status_code=429, headers={"Retry-After": str(self.args.retry_after)})
+            
+        if roll - self.args.p429 < self.args.p500:
+            self.stats[f"{kind}_500"] += 1
+            return Response(status_code=503)
+            
+        return None
+
+
+def create_app(args: argparse.Namespace) -> FastAPI:
+    fake = FakeWildberries(args)
+    app = FastAPI(title="Fake Wildberries")
+    
+    @app.get("/cards/v4/detail")
+    async def card(nm: int = Query()):
+        failure = await fake.inject("card")
+        if failure is not None:
+            return failure
+            
+        fake.stats["card_200"] += 1
+        
+        # Несколько артикулов подряд делят одну карточку, как цвета и размеры одного товара
+        return {"products": [{"id": nm, "root": nm // args.card_group + 1}]}
+        
+    @app.get("/feedbacks/{version}/{imtId}")
+    async def feedbacks(version: str, imtId: int, if_none_match: Optional[str] = Header(default=None)):
+        failure = await fake.inject("feedbacks")
+        if failure is not None:
+            return failure
+            
+        body, etag = fake.body(imtId)
+        
+        if if_none_match == etag:
+            fake.stats["feedbacks_304"] += 1
+            return Response(status_code=304, headers={"ETag": etag})
+            
+        fake.stats["feedbacks_200"] += 1
+        
+        return Response(content=body, media_type="application/json", headers={"ETag": etag})
+        
+    @app.get("/stats")
+    async def stats():
+        return dict(fake.stats)
+        
+    return app
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Fake Wildberries card and feedback API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--feedbacks-min", type=int, default=500, help="Reviews per card, lower bound")
+    parser.add_argument("--feedbacks-max", type=int, default=500, help="Reviews per card, upper bound")
+    parser.add_argument("--recorded", default=None, help="Directory with recorded feedback responses (*.json)")
+    parser.add_argument("--card-group", type=int, default=1, help="Consecutive articles sharing one imtId")
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--p429", type=float, default=0.0, help="Share of 429 responses")
+    parser.add_argument("--p500", type=float, default=0.0, help="Share of 503 responses")
+    parser.add_argument("--ptimeout", type=float, default=0.0, help="Share of requests that hang for --timeout-sleep")
+    parser.add_argument("--timeout-sleep", type=float, default=30)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--cache-cards", type=int, default=1000, help="Generated responses kept in memory")
+    parser.add_argument("--seed", type=int, default=42)
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# Нагрузочный тест API против локальной заглушки Wildberries:
+# python -m benchmarks.load_test [--parse-requests 200 --read-requests 2000 --concurrency 20] [--fake-args "--p429 0.02"]
+# Запускает benchmarks.fake_wb и приложение (uvicorn) с DATABASE_URL из окружения - нужен локальный Postgres.
+# Отчёт: p50/p95/p99, запросов в секунду, ошибки по статусам и пиковая память процесса приложения
+# Внешние зависимости
+import argparse
+import asyncio
+import os
+import random
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List, Optional
+import httpx
+# Внутренние модули
+from benchmarks.fake_wb import app_env
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    latencies: List[float] = field(default_factory=list)
+    statuses: Counter = field(default_factory=Counter)
+    elapsed: float = 0.0
+    
+    def percentile(self, value: int) -> float:
+        if len(self.latencies) < 2:
+            return self.latencies[0] if self.latencies else 0.0
+            
+        return statistics.quantiles(self.latencies, n=100)[value - 1]
+
+
+# Пиковый и текущий RSS процесса по /proc (Linux)
+class MemorySampler:
+    def __init__(self, pid: Optional[int]):
+        self.pid = pid
+        self.peak_kb = 0
+        
+    def sample(self) -> Optional[int]:
+        if self.pid is None:
+            return None
+            
+        try:
+            with open(f"/proc/{self.pid}/status") as status_file:
+                for line in status_file:
+                    if line.startswith("VmRSS:"):
+                        rss_kb = int(line.split()[1])
+                        self.peak_kb = max(self.peak_kb, rss_kb)
+                        return rss_kb
+                        
+        except OSError:
+            return None
+            
+        return None
+        
+    async def run(self, interval: float = 0.2):
+        while True:
+            self.sample()
+            await asyncio.sleep(interval)
+
+
+async def run_scenario(
+    name: str,
+    request: Callable[[int], Awaitable[httpx.Response]],
+    total: int,
+    concurrency: int
+) -> ScenarioResult:
+    result = ScenarioResult(name=name)
+    counter = iter(range(total))
+    
+    async def worker():
+        for index in counter:
+            started = time.perf_counter()
+            
+            try:
+                response = await request(index)
+                result.statuses[response.status_code] += 1
+                
+            except httpx.HTTPError as e:
+                result.statuses[type(e).__name__] += 1
+                
+            result.latencies.append(time.perf_counter() - started)
+            
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.elapsed = time.perf_counter() - started
+    
+    return result
+
+
+def spawn(command: List[str], env: dict) -> subprocess.Popen:
+    return subprocess.Popen(command, env={**os.environ, **env})
+
+
+async def wait_ready(client: httpx.AsyncClient, url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(url)).status_code < 500:
+                return
+                
+        except httpx.HTTPError:
+            pass
+            
+        await asyncio.sleep(0.2)
+        
+    raise RuntimeError(f"{url} is not ready after {timeout} s")
+
+
+def report(results: List[ScenarioResult], sampler: MemorySampler):
+    print(f"{'scenario':>10} {'requests':>9} {'rps':>8} {'p50, ms':>9} {'p95, ms':>9} {'p99, ms':>9}  statuses")
+    
+    for result in results:
+        print(
+            f"{result.name:>10} {len(result.latencies):>9} {len(result.latencies) / result.elapsed:>8.1f} "
+            f"{result.percentile(50) * 1000:>9.1f} {result.percentile(95) * 1000:>9.1f} "
+            f"{result.percentile(99) * 1000:>9.1f}  {dict(result.statuses)}"
+        )
+        
+    if sampler.pid is not None:
+        print(f"app peak RSS: {sampler.peak_kb / 1024:.1f} MiB")
+
+
+async def run(args):
+    processes = []
+    app_url = args.app_url
+    fake_url = f"http://127.0.0.1:{args.fake_port}"
+    
+    try:
+        async with httpx.AsyncClient(timeout=args.timeout, limits=httpx.Limits(max_connections=args.concurrency)) as client:
+            if not args.no_fake:
+                processes.append(spawn(
+                    [sys.executable, "-m", "benchmarks.fake_wb", "--port", str(args.fake_port)] + shlex.split(args.fake_args),
+                    {}
+                ))
+                await wait_ready(client, f"{fake_url}/stats")
+                
+            app_pid = None
+            if app_url is None:
+                app_url = f"http://127.0.0.1:{args.app_port}"
+                app_process = spawn(
+                    [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.app_port), "--log-level", "warning"],
+                    app_env("127.0.0.1", args.fake_port)
+                )
+                processes.append(app_process)
+                app_pid = app_process.pid
+                await wait_ready(client, f"{app_url}/metrics")
+                
+            sampler = MemorySampler(app_pid)
+            sampling = asyncio.create_task(sampler.run())
+            articles = [args.article_base + index for index in range(args.articles)]
+            rng = random.Random(args.seed)
+            
+            async def parse(index: int) -> httpx.Response:
+                return await client.post(
+                    f"{app_url}/api/v1/parse/",
+                    json={"article": articles[index % len(articles)], "rating_stars": 3, "days_passed": 30}
+                )
+                
+            async def read(index: int) -> httpx.Response:
+                return await client.get(f"{app_url}/api/v1/reviews/{rng.choice(articles)}")
+                
+            results = [
+                await run_scenario("parse", parse, args.parse_requests, args.concurrency),
+                await run_scenario("read", read, args.read_requests, args.concurrency)
+            ]
+            
+            sampling.cancel()
+            report(results, sampler)
+            
+            if not args.no_fake:
+                print(f"fake Wildberries: {(await client.get(f'{fake_url}/stats')).json()}")
+                
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /api/v1/parse/ and /api/v1/reviews/{article}")
+    parser.add_argument("--app-url", default=None, help="Already running app; by default one is started on --app-port")
+    parser.add_argument("--app-port", type=int, default=8800)
+    parser.add_argument("--fake-port", type=int, default=9000)
+    parser.add_argument("--no-fake", action="store_true", help="Fake Wildberries is already running on --fake-port")
+    parser.add_argument("--fake-args", default="", help="Extra arguments for benchmarks.fake_wb")
+    parser.add_argument("--articles", type=int, default=100)
+    parser.add_argument("--article-base", type=int, default=100_000_000)
+    parser.add_argument("--parse-requests", type=int, default=200)
+    parser.add_argument("--read-requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+# Внешние зависимости
+import random
+from datetime import datetime, timezone, timedelta
+from typing import List
+
+
+COUNTRIES = ["ru", "by", "kz", "am", "kg", "uz"]
+WORDS = ["брак", "размер", "запах", "доставка", "качество", "цвет", "ткань", "шов", "упаковка", "цена"]
+
+
+# Синтетический отзыв в формате ответа feedbacks.wb.ru
+def make_feedback(rng: random.Random, index: int, now: datetime, max_age_days: int = 365) -> dict:
+    updated = now - timedelta(seconds=rng.randint(0, max_age_days * 86400))
+    created = updated - timedelta(seconds=rng.randint(0, 30 * 86400))
+    
+    return {
+        "id": f"fb{index:012d}",
+        "productValuation": rng.randint(1, 5),
+        "createdDate": created.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "updatedDate": updated.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "text": " ".join(rng.choices(WORDS, k=rng.randint(0, 40))),
+        "pros": " ".join(rng.choices(WORDS, k=rng.randint(0, 10))),
+        "cons": " ".join(rng.choices(WORDS, k=rng.randint(0, 10))),
+        "wbUserDetails": {
+            "country": rng.choice(COUNTRIES),
+            "name": f"Покупатель {index % 1000}"
+        },
+        "photos": [],
+        "votes": {"pluses": rng.randint(0, 50), "minuses": rng.randint(0, 10)}
+    }
+
+
+# Пачка отзывов фиксированного размера (детерминирована по seed)
+def make_feedbacks(count: int, seed: int = 42, max_age_days: int = 365) -> List[dict]:
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    
+    return [make_feedback(rng, index, now, max_age_days) for index in range(count)]